@@ -0,0 +1,5 @@
+"""Benchmarks for the scripts' hot paths, on synthetic data
+
+Run with `python -m benchmarks.bench`, see --help for saving and comparing
+results against a baseline.
+"""
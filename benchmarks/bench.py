@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""Time the scripts' hot paths on synthetic data
+
+Each benchmark is set up outside the timed section, run --repeat times and
+the best time kept. Results can be saved as json and later compared against,
+a benchmark slower than the baseline by more than --threshold fails the run.
+"""
+
+import fnmatch
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import utils
+from benchmarks import synthetic
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+	"""Decorator registering a benchmark
+
+	The function takes the scale and returns (run, units, unit), where run is
+	the callable timed and units the amount of work done by one run.
+	"""
+	def decorator(func):
+		BENCHMARKS[name] = func
+		return func
+	return decorator
+
+
+def scaled(n, scale):
+	return max(1, int(n * scale))
+
+
+@benchmark("extract.texture2d")
+def bench_extract_textures(scale):
+	from extract import handle_asset
+	from handlers import Options
+
+	count = scaled(16, scale)
+	asset = synthetic.texture_asset(count, 256)
+	return lambda: handle_asset(asset, ["Texture2D"], synthetic.NullSink(), Options()), count, "objects"
+
+
+@benchmark("extract.textasset")
+def bench_extract_text(scale):
+	from extract import handle_asset
+	from handlers import Options
+
+	count = scaled(2000, scale)
+	asset = synthetic.text_asset(count, 4096)
+	return lambda: handle_asset(asset, ["TextAsset"], synthetic.NullSink(), Options()), count, "objects"
+
+
+@benchmark("dump_yaml.yaml")
+def bench_dump_yaml(scale):
+	import dump_yaml
+
+	records = synthetic.unity_records(scaled(1000, scale))
+	return lambda: [dump_yaml.serialize(r) for r in records], len(records), "objects"
+
+
+@benchmark("dump_yaml.jsonl")
+def bench_dump_jsonl(scale):
+	import dump_yaml
+
+	records = synthetic.unity_records(scaled(5000, scale))
+	def run():
+		for i, r in enumerate(records):
+			dump_yaml.serialize_json(i, "GameObject", r)
+	return run, len(records), "objects"
+
+
+@benchmark("gameobject_search.build_dict")
+def bench_build_dict(scale):
+	from gameobject_search import build_dict
+
+	count = scaled(20000, scale)
+	asset = synthetic.game_object_asset(count)
+	return lambda: build_dict("synthetic/gameobjects", asset), count, "objects"
+
+
+@benchmark("gameobject_tree.dump_json")
+def bench_dump_json(scale):
+	depth, children = 4, scaled(6, scale)
+	tree = synthetic.object_tree(depth, children)
+	nodes = sum(children ** i for i in range(depth + 1))
+	return lambda: utils.dump_json(tree), nodes, "nodes"
+
+
+def mesh_benchmark(name, export):
+	@benchmark(name)
+	def bench(scale):
+		data = synthetic.grid_mesh(scaled(40000, scale), submeshes=2)
+		return lambda: export(data), len(data.vertices), "vertices"
+	return bench
+
+
+def export_babylon(data):
+	from meshes import BabylonMesh
+	return BabylonMesh(None, data).export()
+
+
+def export_obj(data):
+	from meshes import OBJMesh
+	return OBJMesh(None, data).export()
+
+
+def export_json(data):
+	from meshes import JSONMesh
+	return JSONMesh(None, data).export()
+
+
+def optimize_mesh(data):
+	from meshes import optimize
+	return optimize(data, weld=True, reorder=True, quantized=True)
+
+
+mesh_benchmark("meshes.babylon", export_babylon)
+mesh_benchmark("meshes.obj", export_obj)
+mesh_benchmark("meshes.json", export_json)
+mesh_benchmark("meshes.optimize", optimize_mesh)
+
+
+def sink_benchmark(name, archive):
+	@benchmark(name)
+	def bench(scale):
+		from sinks import open_sink
+
+		entries = synthetic.files(scaled(200, scale), 64 * 1024)
+		size = sum(len(data) for path, data in entries)
+
+		def run():
+			with tempfile.TemporaryDirectory() as tmp:
+				with open_sink(tmp, "bundle", archive) as sink:
+					for path, data in entries:
+						sink.write(path, data, mode="wb")
+		return run, size, "bytes"
+	return bench
+
+
+sink_benchmark("sinks.directory", None)
+sink_benchmark("sinks.zip", "zip")
+sink_benchmark("sinks.tar.gz", "tar.gz")
+sink_benchmark("sinks.tar.zst", "tar.zst")
+
+
+def glsl_benchmark(name, stage):
+	@benchmark(name)
+	def bench(scale):
+		from benchmarks import glsl
+		return glsl.stage_benchmark(stage, scale)
+	return bench
+
+
+glsl_benchmark("glsl.parse", "parse")
+glsl_benchmark("glsl.build", "build")
+glsl_benchmark("glsl.clean_up", "clean_up")
+
+
+def run_benchmark(name, scale, repeat):
+	run, units, unit = BENCHMARKS[name](scale)
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		run()
+		times.append(time.perf_counter() - start)
+	best = min(times)
+	return {
+		"best": best,
+		"median": statistics.median(times),
+		"units": units,
+		"unit": unit,
+		"rate": units / best if best > 0 else 0.0,
+	}
+
+
+def compare(results, baseline, threshold):
+	"""Print the change against the baseline, return the regressed names"""
+	regressions = []
+	print()
+	print("%-32s %12s %12s %9s" % ("benchmark", "baseline", "current", "change"))
+	for name, result in results.items():
+		base = baseline.get(name)
+		if base is None:
+			print("%-32s %12s %11.4fs %9s" % (name, "-", result["best"], "new"))
+			continue
+		change = result["best"] / base["best"] - 1
+		flag = ""
+		if change > threshold:
+			flag = " REGRESSION"
+			regressions.append(name)
+		print("%-32s %11.4fs %11.4fs %+8.1f%%%s" % (
+			name, base["best"], result["best"], change * 100, flag
+		))
+	return regressions
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("--only", nargs="+", metavar="PATTERN",
+		help="only run the benchmarks matching these glob patterns")
+	p.add_argument("--list", action="store_true", help="list the benchmarks")
+	p.add_argument("--repeat", type=int, default=5)
+	p.add_argument("--scale", type=float, default=1.0,
+		help="multiplier for the size of the synthetic data")
+	p.add_argument("--save", metavar="FILE", help="write the results as json")
+	p.add_argument("--compare", metavar="FILE", help="a baseline saved with --save")
+	p.add_argument("--threshold", type=float, default=0.1,
+		help="slowdown against the baseline that counts as a regression")
+	args = p.parse_args(sys.argv[1:])
+
+	if args.list:
+		for name in BENCHMARKS:
+			print(name)
+		return
+
+	names = [
+		name for name in BENCHMARKS
+		if not args.only or any(fnmatch.fnmatch(name, pat) for pat in args.only)
+	]
+
+	# the scripts' own output would only add noise
+	utils.Echo.very_quiet = True
+
+	results = {}
+	for name in names:
+		try:
+			result = run_benchmark(name, args.scale, args.repeat)
+		except ImportError as e:
+			print("%-32s skipped (%s)" % (name, e))
+			continue
+		results[name] = result
+		print("%-32s %9.4fs %14.1f %s/s" % (
+			name, result["best"], result["rate"], result["unit"]
+		))
+
+	if args.save:
+		with open(args.save, "w") as f:
+			json.dump({
+				"python": platform.python_version(),
+				"platform": platform.platform(),
+				"scale": args.scale,
+				"repeat": args.repeat,
+				"results": results,
+			}, f, indent=4)
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		if baseline.get("scale") != args.scale:
+			print("WARNING: baseline was run with --scale %s" % (baseline.get("scale")))
+		regressions = compare(results, baseline["results"], args.threshold)
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""Micro benchmarks for the GLSL parse, clean up and build stages
+
+The corpus is generated deterministically in the style of mojoshader's GLSL
+output: short programs, long ones, deeply nested binary operations and
+if/else blocks. Every program round trips through glsl_parser unchanged.
+For each program and stage the best time, parse tokens per second and the
+peak memory and allocated blocks (from tracemalloc) are reported.
+"""
+
+import random
+import re
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import glsl_parser
+
+
+# roughly what pyparsing has to match, identifiers, numbers and punctuation
+TOKEN = re.compile(r"[A-Za-z_]\w*|\d+\.\d+|\d+|\S")
+
+SWIZZLES = ["x", "y", "z", "w", "xy", "xyz", "xyxy", "xxxx", "wzyx", "yyyy"]
+OPERATORS = ["+", "-", "*", "/"]
+COMPARATORS = ["<", ">", "<=", ">=", "==", "!="]
+FUNCTIONS_2 = ["dot", "max", "min", "pow", "step"]
+FUNCTIONS_3 = ["clamp", "mix", "smoothstep"]
+
+
+class Generator:
+	"""Writes a mojoshader-like program, prefix is "vs" or "ps" """
+
+	def __init__(self, prefix, seed=0, registers=8, constants=16):
+		self.prefix = prefix
+		self.rng = random.Random(seed)
+		self.registers = registers
+		self.constants = constants
+
+	def register(self):
+		r = "%s_r%i" % (self.prefix, self.rng.randrange(self.registers))
+		if self.rng.random() < 0.6:
+			r += "." + self.rng.choice(SWIZZLES)
+		return r
+
+	def operand(self):
+		roll = self.rng.random()
+		if roll < 0.55:
+			return self.register()
+		elif roll < 0.75:
+			return "%s_c%i.%s" % (
+				self.prefix, self.constants, self.rng.choice(SWIZZLES)
+			)
+		elif roll < 0.9:
+			return "%s_c[%i]" % (self.prefix, self.rng.randrange(self.constants))
+		return "%.1f" % (self.rng.uniform(-4, 4))
+
+	def binary(self):
+		return "%s %s %s" % (
+			self.operand(), self.rng.choice(OPERATORS), self.operand()
+		)
+
+	def nested(self, depth):
+		"""A binary operation nested depth times, as in ((a * b) + c) - d"""
+		if depth == 0:
+			return self.binary()
+		return "(%s) %s %s" % (
+			self.nested(depth - 1), self.rng.choice(OPERATORS), self.operand()
+		)
+
+	def function(self):
+		if self.rng.random() < 0.6:
+			name = self.rng.choice(FUNCTIONS_2)
+			params = [self.operand(), self.operand()]
+		else:
+			name = self.rng.choice(FUNCTIONS_3)
+			params = [self.operand(), self.operand(), self.operand()]
+		return "%s(%s)" % (name, ", ".join(params))
+
+	def ternary(self):
+		return "((%s %s %s) ? %s : %s)" % (
+			self.register(), self.rng.choice(COMPARATORS), self.operand(),
+			self.operand(), self.operand()
+		)
+
+	def instruction(self, depth=0, indent="\t"):
+		roll = self.rng.random()
+		if depth:
+			expr = self.nested(depth)
+		elif roll < 0.4:
+			expr = self.binary()
+		elif roll < 0.7:
+			expr = self.function()
+		elif roll < 0.85:
+			expr = self.ternary()
+		else:
+			expr = "-" + self.register()
+		return "%s%s = %s;" % (indent, self.register(), expr)
+
+	def if_block(self, size=3):
+		lines = ["\tif (%s %s %s) {" % (
+			self.register(), self.rng.choice(COMPARATORS), self.operand()
+		)]
+		lines.extend(self.instruction(indent="\t\t") for i in range(size))
+		if self.rng.random() < 0.7:
+			lines.append("\t} else {")
+			lines.extend(self.instruction(indent="\t\t") for i in range(size))
+		lines.append("\t}")
+		return lines
+
+	def declarations(self):
+		p = self.prefix
+		lines = ["uniform vec4 %s_c[%i];" % (p, self.constants)]
+		lines.append("const vec4 %s_c%i = vec4(0.5, 1.0, 0.0, -2.0);" % (p, self.constants))
+		if p == "vs":
+			lines.extend("attribute vec4 vs_v%i;" % (i) for i in range(3))
+			lines.append("#define vs_o0 gl_Position")
+			lines.extend("varying vec4 vs_o%i;" % (i) for i in range(1, 3))
+		else:
+			lines.append("uniform sampler2D ps_s0;")
+			lines.extend("varying vec4 ps_t%i;" % (i) for i in range(2))
+			lines.append("#define ps_oC0 gl_FragColor")
+		lines.extend("vec4 %s_r%i;" % (p, i) for i in range(self.registers))
+		return lines
+
+	def program(self, instructions, depth=0, branches=0):
+		lines = ["#version 110"]
+		lines.extend(self.declarations())
+		lines.extend(["", "void main()", "{"])
+		body = [[self.instruction(depth)] for i in range(instructions)]
+		# spread the if blocks through the program
+		for i in range(branches):
+			body.insert(self.rng.randrange(len(body) + 1), self.if_block())
+		for block in body:
+			lines.extend(block)
+		if self.prefix == "ps":
+			lines.append("\tif (any(lessThan(ps_r0, vec4(0.0)))) discard;")
+			lines.append("\tps_oC0 = ps_r0;")
+		else:
+			lines.append("\tvs_o0 = vs_r0;")
+		lines.append("}")
+		return "\n".join(lines)
+
+
+def corpus(scale=1.0, seed=0):
+	"""The benchmark programs, by name"""
+	def n(count):
+		return max(1, int(count * scale))
+
+	return {
+		"short_vertex": Generator("vs", seed).program(n(12)),
+		"short_fragment": Generator("ps", seed + 1).program(n(8), branches=1),
+		"long_vertex": Generator("vs", seed + 2).program(n(400)),
+		"nested_fragment": Generator("ps", seed + 3).program(n(40), depth=4),
+		"branching_fragment": Generator("ps", seed + 4).program(n(60), branches=n(20)),
+	}
+
+
+def count_tokens(text):
+	return len(TOKEN.findall(text))
+
+
+class ParsedShader:
+	"""Stands in for a mojoparser result, for running shaders.clean_up
+
+	It holds the program text and no symbols, so the symbol mapping does no
+	work and the timing is that of the parse, filter and build passes.
+	"""
+
+	def __init__(self, text, shader_type):
+		self.text = text
+		self.shader_type = shader_type
+		self.symbols = self.outputs = self.attributes = self.uniforms = []
+		self.symbol_count = self.output_count = 0
+		self.attribute_count = self.uniform_count = 0
+
+	def __str__(self):
+		return self.text
+
+
+def stage(name, text):
+	"""The callable running stage name on text, set up outside the timing"""
+	if name == "parse":
+		return lambda: glsl_parser.parse(text)
+	elif name == "build":
+		parsed, idents = glsl_parser.parse(text)
+		return lambda: glsl_parser.build(parsed)
+	elif name == "clean_up":
+		# needs mojoparser, raises ImportError without it
+		import mojoparser
+		from shaders import clean_up
+
+		shader_type = mojoparser.ShaderType.VERTEX
+		if "ps_oC0" in text:
+			shader_type = mojoparser.ShaderType.PIXEL
+		parsed = ParsedShader(text, shader_type)
+		return lambda: clean_up(parsed, ["SYNTHETIC"])
+	raise ValueError("Unknown stage %r" % (name))
+
+
+STAGES = ["parse", "build", "clean_up"]
+
+
+def measure(run, repeat):
+	"""Best time over repeat runs, and the memory used by one more run"""
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		run()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	tracemalloc.start()
+	try:
+		before = tracemalloc.take_snapshot()
+		result = run()
+		after = tracemalloc.take_snapshot()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+	del result
+	return best, peak, blocks
+
+
+def stage_benchmark(name, scale=1.0):
+	"""A (run, units, unit) benchmark over the whole corpus, for bench.py"""
+	programs = list(corpus(scale).values())
+	runs = [stage(name, text) for text in programs]
+	tokens = sum(count_tokens(text) for text in programs)
+
+	def run():
+		for r in runs:
+			r()
+	return run, tokens, "tokens"
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+	p.add_argument("--repeat", type=int, default=5)
+	p.add_argument("--scale", type=float, default=1.0,
+		help="multiplier for the length of the generated programs")
+	p.add_argument("--print", metavar="NAME", help="print a corpus program and exit")
+	args = p.parse_args(sys.argv[1:])
+
+	programs = corpus(args.scale)
+	if args.print:
+		print(programs[args.print])
+		return
+
+	print("%-20s %-9s %8s %10s %12s %10s %9s" % (
+		"program", "stage", "tokens", "time", "tokens/s", "peak KiB", "blocks"
+	))
+	for stage_name in args.stages:
+		for name, text in programs.items():
+			try:
+				run = stage(stage_name, text)
+			except ImportError as e:
+				print("%-20s %-9s skipped (%s)" % (name, stage_name, e))
+				break
+			tokens = count_tokens(text)
+			best, peak, blocks = measure(run, args.repeat)
+			print("%-20s %-9s %8i %9.4fs %12.0f %10.1f %9i" % (
+				name, stage_name, tokens, best, tokens / best, peak / 1024, blocks
+			))
+
+
+if __name__ == "__main__":
+	main()
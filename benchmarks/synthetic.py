@@ -0,0 +1,195 @@
+"""Deterministic synthetic stand-ins for unity objects and assets
+
+Nothing here is read from client data. The stand-ins only implement what the
+scripts use (ObjectInfo.type/read(), Asset.objects, the engine object fields),
+so the same seed always produces the same objects.
+"""
+
+import math
+import random
+
+import numpy as np
+from PIL import Image
+
+from meshes import MeshArrays
+from objects import Color, Vec3, Vec4
+from sinks import Sink
+
+
+class SyntheticObject:
+	"""Stands in for an ObjectInfo, read() returns the prepared object"""
+
+	def __init__(self, type, obj):
+		self.type = type
+		self.obj = obj
+
+	def read(self):
+		return self.obj
+
+
+class SyntheticAsset:
+	"""Stands in for an Asset, objects maps path ids to SyntheticObjects"""
+
+	def __init__(self, name, objects=None):
+		self.name = name
+		self.objects = objects if objects is not None else {}
+
+	def add(self, type, obj):
+		path_id = len(self.objects) + 1
+		self.objects[path_id] = SyntheticObject(type, obj)
+		return path_id
+
+
+class Texture2D:
+	def __init__(self, name, image):
+		self.name = name
+		self.image = image
+
+
+class TextAsset:
+	def __init__(self, name, script):
+		self.name = name
+		self.script = script
+
+
+class GameObject:
+	def __init__(self, name, obj):
+		self.name = name
+		self._obj = obj
+
+
+def texture_image(size, seed=0):
+	"""A RGBA image, a gradient with noise so it doesn't compress to nothing"""
+	rng = np.random.default_rng(seed)
+	ramp = np.linspace(0, 255, size, dtype=np.float32)
+	pixels = np.empty((size, size, 4), dtype=np.uint8)
+	pixels[..., 0] = ramp[None, :]
+	pixels[..., 1] = ramp[:, None]
+	pixels[..., 2] = rng.integers(0, 256, (size, size), dtype=np.uint8)
+	pixels[..., 3] = 255
+	return Image.fromarray(pixels, "RGBA")
+
+
+def grid_mesh(vertex_count, submeshes=1, seed=0):
+	"""A bumpy grid of about vertex_count vertices, split into submeshes"""
+	rng = np.random.default_rng(seed)
+	side = max(2, math.isqrt(vertex_count))
+	u, v = np.meshgrid(np.linspace(0, 1, side), np.linspace(0, 1, side))
+	u, v = u.ravel(), v.ravel()
+	height = rng.normal(0, 0.05, len(u))
+	vertices = np.stack([u * 10, height, v * 10], axis=1).astype(np.float32)
+	normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (len(u), 1))
+	uvs = [np.stack([u, v], axis=1).astype(np.float32)]
+	# two triangles per grid cell
+	cells = np.arange(side * side).reshape(side, side)[:-1, :-1].ravel()
+	quads = np.stack([cells, cells + 1, cells + side, cells + side + 1], axis=1)
+	triangles = quads[:, [0, 2, 1, 1, 2, 3]].reshape(-1, 3)
+	parts = np.array_split(triangles, submeshes)
+	return MeshArrays(
+		"grid_%i" % (vertex_count),
+		vertices,
+		normals,
+		uvs=uvs,
+		submeshes=[p.ravel() for p in parts],
+	)
+
+
+def unity_record(rng, index):
+	"""A decoded GameObject-like record, as the dumps see an object's fields"""
+	return {
+		"m_Name": "GameObject_%i" % (index),
+		"m_Component": [
+			{"component": {"m_FileID": 0, "m_PathID": rng.randrange(1, 1 << 40)}}
+			for i in range(rng.randint(1, 6))
+		],
+		"m_Layer": rng.randint(0, 31),
+		"m_Tag": 0,
+		"m_IsActive": rng.random() > 0.1,
+		"m_LocalPosition": {"x": rng.uniform(-10, 10), "y": rng.uniform(-10, 10), "z": rng.uniform(-10, 10)},
+		"m_LocalRotation": {"x": 0.0, "y": rng.random(), "z": 0.0, "w": rng.random()},
+		"m_LocalScale": {"x": 1.0, "y": 1.0, "z": 1.0},
+		"m_Colors": {
+			"_Color%i" % (i): {"r": rng.random(), "g": rng.random(), "b": rng.random(), "a": 1.0}
+			for i in range(4)
+		},
+	}
+
+
+def unity_records(count, seed=0):
+	rng = random.Random(seed)
+	return [unity_record(rng, i) for i in range(count)]
+
+
+def object_tree(depth, children, seed=0):
+	"""A nested GameObject tree, shaped like gameobject_tree.py's json export"""
+	rng = random.Random(seed)
+
+	def node(level, index):
+		return {
+			"name": "node_%i_%i" % (level, index),
+			"transform": {
+				"position": Vec3(rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(-10, 10)),
+				"rotation": Vec4(0.0, rng.random(), 0.0, rng.random()),
+				"scale": Vec3(1.0, 1.0, 1.0),
+			},
+			"mesh": "mesh_%i" % (index),
+			"materials": [{
+				"name": "material_%i" % (index),
+				"uniforms": {
+					"_Color": Color(rng.random(), rng.random(), rng.random(), 1.0),
+					"_Glossiness": rng.random(),
+				},
+			}],
+			"scripts": [],
+			"children": [node(level + 1, i) for i in range(children)] if level < depth else [],
+		}
+
+	return node(0, 0)
+
+
+def texture_asset(count, size, seed=0):
+	asset = SyntheticAsset("textures")
+	for i in range(count):
+		asset.add("Texture2D", Texture2D("texture_%i" % (i), texture_image(size, seed + i)))
+	return asset
+
+
+def text_asset(count, size, seed=0):
+	rng = random.Random(seed)
+	asset = SyntheticAsset("text")
+	words = ["card", "hero", "spell", "minion", "weapon", "deck", "mana", "attack"]
+	for i in range(count):
+		script = " ".join(rng.choice(words) for w in range(size // 6))
+		asset.add("TextAsset", TextAsset("text_%i" % (i), script))
+	return asset
+
+
+def game_object_asset(count, seed=0):
+	rng = random.Random(seed)
+	asset = SyntheticAsset("gameobjects")
+	for i, record in enumerate(unity_records(count, seed)):
+		# plenty of duplicate names, like the client's prefabs
+		name = "GameObject_%i" % (rng.randrange(max(1, count // 4)))
+		asset.add("GameObject", GameObject(name, record))
+	return asset
+
+
+def files(count, size, seed=0):
+	"""(path, bytes) pairs, as handlers write them to a sink"""
+	rng = random.Random(seed)
+	return [
+		("Texture2D/file_%i.bin" % (i), rng.randbytes(size))
+		for i in range(count)
+	]
+
+
+class NullSink(Sink):
+	"""A sink discarding everything, counting the bytes written"""
+
+	def __init__(self, root=""):
+		super().__init__(root)
+		self.written = 0
+
+	def write(self, path, contents, mode="w"):
+		with self.lock:
+			self.written += len(contents)
@@ -0,0 +1,203 @@
+"""Record the work done by a run, so an interrupted run can be resumed
+
+The checkpoint is an append-only log, a line per completed unit, after a
+header with the options of the run:
+
+	#{"formats": [...], ...}        the options, as json
+	bundle<TAB>asset<TAB>path_id    an object
+	bundle                          a whole bundle
+
+A run only resumes from a checkpoint made with the same options. A plain run
+replaces the checkpoint of an earlier one in the output directory, but one
+given explicitly with --checkpoint is only replaced when asked to restart.
+
+Appending is cheap and a line cut short by a crash is ignored when the log
+is read back. The log is compacted, to a line per finished bundle plus the
+objects of the unfinished ones, by writing a new file and os.replace()-ing
+it over the old one, so it is never left half written.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import utils
+
+
+# seconds between flushes of the log to disk
+FLUSH_INTERVAL = 5.0
+
+
+class Checkpoint:
+	def __init__(self, path, options=None, resume=False, restart=False):
+		self.path = path
+		# as read back from the header
+		self.options = json.loads(json.dumps(options or {}))
+		self.lock = threading.Lock()
+		self.bundles = set()
+		self.objects = set()
+		self.file = None
+		if os.path.exists(path) and not restart:
+			if not resume:
+				raise ValueError(
+					"%s exists, use --resume to continue its run or --restart to start over" % (path)
+				)
+			header = self.load()
+			if header != self.options:
+				raise ValueError(
+					"%s was made with other options (%s), use --restart to start over"
+					% (path, json.dumps(header, sort_keys=True))
+				)
+		dirs = os.path.dirname(path)
+		if dirs:
+			os.makedirs(dirs, exist_ok=True)
+		# also writes the header of a new checkpoint
+		self.compact()
+		self.file = open(path, "a", encoding="utf-8")
+		self.flushed = time.monotonic()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def load(self):
+		"""Read the units back, returns the options in the header"""
+		header = None
+		with open(self.path, encoding="utf-8") as f:
+			for line in f:
+				if not line.endswith("\n"):
+					# cut short, the unit was not recorded
+					break
+				if line.startswith("#"):
+					header = json.loads(line[1:])
+					continue
+				fields = line[:-1].split("\t")
+				if len(fields) == 1:
+					self.bundles.add(fields[0])
+				elif len(fields) == 3:
+					self.objects.add((fields[0], fields[1], int(fields[2])))
+		return header
+
+	def bundle_done(self, bundle):
+		return bundle in self.bundles
+
+	def object_done(self, bundle, asset, path_id):
+		return (bundle, asset, path_id) in self.objects
+
+	def _append(self, lines, flush=False):
+		with self.lock:
+			self.file.write("".join(lines))
+			now = time.monotonic()
+			if flush or now - self.flushed >= FLUSH_INTERVAL:
+				self.file.flush()
+				os.fsync(self.file.fileno())
+				self.flushed = now
+
+	def mark_objects(self, bundle, asset, path_ids):
+		lines = []
+		for path_id in path_ids:
+			self.objects.add((bundle, asset, path_id))
+			lines.append("%s\t%s\t%i\n" % (bundle, asset, path_id))
+		if lines:
+			self._append(lines)
+
+	def mark_bundle(self, bundle):
+		self.bundles.add(bundle)
+		self._append([bundle + "\n"], flush=True)
+
+	def compact(self):
+		"""Atomically rewrite the log without the redundant lines"""
+		with self.lock:
+			if self.file:
+				self.file.flush()
+			self.objects = {o for o in self.objects if o[0] not in self.bundles}
+			tmp = self.path + ".tmp"
+			with open(tmp, "w", encoding="utf-8") as f:
+				f.write("#" + json.dumps(self.options, sort_keys=True) + "\n")
+				for bundle in sorted(self.bundles):
+					f.write(bundle + "\n")
+				for bundle, asset, path_id in sorted(self.objects):
+					f.write("%s\t%s\t%i\n" % (bundle, asset, path_id))
+				f.flush()
+				os.fsync(f.fileno())
+			if self.file:
+				self.file.close()
+			os.replace(tmp, self.path)
+			if self.file:
+				self.file = open(self.path, "a", encoding="utf-8")
+
+	def scope(self, bundle):
+		"""The checkpoint of a single bundle"""
+		return BundleCheckpoint(self, bundle)
+
+	def close(self):
+		if self.file:
+			self.compact()
+			self.file.close()
+			self.file = None
+
+
+class BundleCheckpoint:
+	def __init__(self, checkpoint, bundle):
+		self.checkpoint = checkpoint
+		self.bundle = bundle
+
+	def pending(self, asset, ids):
+		"""The ids not done yet, of the objects in asset"""
+		return [
+			id for id in ids
+			if not self.checkpoint.object_done(self.bundle, asset.name, id)
+		]
+
+	def mark(self, asset, ids):
+		self.checkpoint.mark_objects(self.bundle, asset.name, ids)
+
+
+class Recorder:
+	"""Collects the objects done by a worker, marked by the parent process
+
+	The tasks given to workers only hold pending objects, nothing is skipped.
+	"""
+
+	def __init__(self):
+		self.marks = []
+
+	def pending(self, asset, ids):
+		return list(ids)
+
+	def mark(self, asset, ids):
+		if ids:
+			self.marks.append((asset.name, list(ids)))
+
+	def apply(self, checkpoint, bundle):
+		for asset, ids in self.marks:
+			checkpoint.mark_objects(bundle, asset, ids)
+
+
+def add_arguments(parser):
+	group = parser.add_mutually_exclusive_group()
+	group.add_argument("--resume", action="store_true",
+		help="skip the work recorded as done in the checkpoint")
+	group.add_argument("--restart", action="store_true",
+		help="start over, replacing the checkpoint of an earlier run")
+	parser.add_argument("--checkpoint", metavar="FILE",
+		help="the checkpoint file, by default in the output directory")
+
+
+def open_checkpoint(args, output, name, options=None):
+	"""The Checkpoint of the run, at --checkpoint or output/.name.checkpoint
+
+	options, a json serializable dict, are those the work done depends on.
+	"""
+	path = args.checkpoint or os.path.join(output, "." + name + ".checkpoint")
+	# the default checkpoint is the run's own, rerunning starts it over
+	restart = args.restart or (not args.resume and not args.checkpoint)
+	try:
+		return Checkpoint(path, options, resume=args.resume, restart=restart)
+	except ValueError as e:
+		utils.Echo.error("%s", e)
+		sys.exit(1)
@@ -0,0 +1,93 @@
+"""Command line options shared by all the scripts
+
+	p = ArgumentParser()
+	...
+	cli.add_arguments(p)
+	args = cli.parse_args(p)
+
+adds and applies -q/-qq, --log-format, --stats and --profile. The profile and the stats
+are written when the script exits. Wrapping the work on each bundle in
+cli.bundle(name) attributes the stats to it, and with --profile-per-bundle
+writes a separate profile for it.
+"""
+
+import atexit
+import re
+import sys
+from contextlib import contextmanager
+
+import metrics
+import utils
+from profiling import MODES, Profiler
+
+
+(debug, info, error) = utils.Echo.echo()
+
+# the parsed arguments of the running script
+_args = None
+
+
+def add_arguments(parser, progress=False):
+	parser.add_argument("-q", action="store_true")
+	parser.add_argument("-qq", action="store_true")
+	parser.add_argument("--log-format", choices=["text", "json"], default="text",
+		help="write the messages as plain text or json records")
+	metrics.add_argument(parser)
+	parser.add_argument("--profile", choices=MODES,
+		help="run under cProfile (pstats output) or tracemalloc (snapshots)")
+	parser.add_argument("--profile-dir", default="profiles",
+		help="directory for the --profile output")
+	parser.add_argument("--profile-per-bundle", action="store_true",
+		help="write a separate profile for each bundle")
+	if progress:
+		parser.add_argument("--progress", action="store_true",
+			help="show the progress, throughput and time left (counts the objects first)")
+
+
+def tool_name():
+	return utils.filename_no_ext(sys.argv[0]) or "python"
+
+
+def parse_args(parser, argv=None):
+	"""Parse the arguments and apply the shared options"""
+	args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+	setup(args)
+	return args
+
+
+def setup(args):
+	global _args
+	_args = args
+
+	utils.Echo.configure(args.q, args.qq, json=args.log_format == "json")
+	metrics.enable(args)
+
+	profiler = None
+	if args.profile and not args.profile_per_bundle:
+		profiler = Profiler(args.profile, args.profile_dir, tool_name())
+		profiler.start()
+	atexit.register(finish, args, profiler)
+
+
+def finish(args, profiler=None):
+	if profiler:
+		path = profiler.stop()
+		info("Profile written to %s", path, path=path)
+	metrics.report(args)
+
+
+@contextmanager
+def bundle(name):
+	"""Attribute the stats, and the profile with --profile-per-bundle, to name"""
+	with metrics.METRICS.bundle(name):
+		if not (_args and _args.profile and _args.profile_per_bundle):
+			yield
+			return
+		safe_name = re.sub(r"[^\w.-]+", "_", name)
+		profiler = Profiler(_args.profile, _args.profile_dir, tool_name() + "-" + safe_name)
+		profiler.start()
+		try:
+			yield
+		finally:
+			path = profiler.stop()
+			info("Profile written to %s", path, path=path)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+"""Keep the bundles loaded and answer lookups over a local socket
+
+Starting the scripts, importing unitypack, PIL and the shader parsers, and
+loading the bundles again for each lookup takes far longer than the lookup
+itself. The daemon pays for it once:
+
+	daemon.py bundles/ --cache cache/
+
+then serves daemon_client.py (search, extract, prefab, shader, stats and
+stop) on a Unix socket, only reachable by the user running it. It keeps
+the bundles it has loaded, the game object index (from gameobject_search.py
+cache files when given --cache, built when missing) and the last objects
+read.
+"""
+
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+from unitypack.environment import UnityEnvironment
+
+import cli
+import extract
+import metrics
+import utils
+from daemon_client import DEFAULT_SOCKET, send, receive
+from gameobject_search import bundle_dict, get_bundle_cache, save_bundle_cache
+from gameobject_tree import export_prefab
+from handlers import HANDLERS, Options
+from shaders import extract_shader, redefine_shader
+from sinks import DirectorySink
+
+
+(debug, info, error) = utils.Echo.echo()
+
+# objects kept read, the least recently used are dropped first
+OBJECT_CACHE = 512
+
+
+class ListingSink(DirectorySink):
+	"""A DirectorySink keeping the paths it has written"""
+
+	def __init__(self, root=""):
+		super().__init__(root)
+		self.paths = []
+
+	def write(self, path, contents, mode="w"):
+		super().write(path, contents, mode)
+		self.paths.append(os.path.join(self.root, path))
+
+	def open(self, path, mode="wb"):
+		self.paths.append(os.path.join(self.root, path))
+		return super().open(path, mode)
+
+
+class Daemon:
+	"""The loaded bundles, the index and the caches, with the RPC methods
+
+	unitypack isn't thread safe, requests run one at a time under the lock.
+	"""
+
+	def __init__(self, files, cache_dir=None, object_cache=OBJECT_CACHE):
+		self.files = {utils.filename_no_ext(f): f for f in files}
+		self.cache_dir = cache_dir
+		self.object_cache = object_cache
+		self.env = UnityEnvironment()
+		self.bundles = {}
+		# lower case name -> [gameobject_search.GameObject]
+		self.index = {}
+		# path id -> names of the bundles with a game object of that id
+		self.ids = {}
+		# (bundle, path id) -> (ObjectInfo, object)
+		self.objects = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.RLock()
+		self.ready = threading.Event()
+		self.started = time.time()
+		self.server = None
+		self.methods = {
+			"search": self.search,
+			"extract": self.extract,
+			"prefab": self.prefab,
+			"shader": self.shader,
+			"stats": self.stats,
+			"stop": self.stop,
+		}
+
+	def bundle(self, name):
+		"""The loaded bundle, loaded into the environment the first time"""
+		if name not in self.bundles:
+			if name not in self.files:
+				raise KeyError("No bundle %r" % (name))
+			f = open(self.files[name], "rb")
+			self.env.files.append(f)
+			with metrics.timer("load"):
+				self.bundles[name] = self.env.load(f)
+		return self.bundles[name]
+
+	def warm(self):
+		"""Build the game object index, from the cache files when there are"""
+		for name in sorted(self.files):
+			# let requests in between the bundles
+			with self.lock, cli.bundle(name):
+				try:
+					go_dict = get_bundle_cache(self.cache_dir, name) if self.cache_dir else None
+					if go_dict is None:
+						go_dict = bundle_dict(name, self.bundle(name))
+						if self.cache_dir and go_dict:
+							save_bundle_cache(self.cache_dir, name, go_dict)
+				except Exception as e:
+					error("Could not index %s (%s)", name, e, bundle=name)
+					continue
+				for key, gameobjects in go_dict.items():
+					self.index.setdefault(key, []).extend(gameobjects)
+					for go in gameobjects:
+						self.ids.setdefault(go.id, set()).add(go.bundle)
+		info("Indexed %i game object names", len(self.index), names=len(self.index))
+		utils.Echo.flush()
+		self.ready.set()
+
+	def read(self, bundle_name, path_id):
+		"""(ObjectInfo, object) for the object path_id of the bundle"""
+		key = (bundle_name, path_id)
+		if key in self.objects:
+			self.hits += 1
+			self.objects.move_to_end(key)
+			return self.objects[key]
+		self.misses += 1
+		for asset in self.bundle(bundle_name).assets:
+			if path_id in asset.objects:
+				obj = asset.objects[path_id]
+				with metrics.timer("read"):
+					d = obj.read()
+				self.objects[key] = (obj, d)
+				if len(self.objects) > self.object_cache:
+					self.objects.popitem(last=False)
+				return obj, d
+		raise KeyError("No object %i in %s" % (path_id, bundle_name))
+
+	def search(self, term):
+		self.ready.wait()
+		term = term.lower()
+		results = []
+		for name, gameobjects in self.index.items():
+			if term in name:
+				results.extend(
+					{"id": go.id, "name": go.name, "bundle": go.bundle} for go in gameobjects
+				)
+		return results
+
+	def extract(self, bundle, id, output):
+		"""Run the extract.py handler of the object, returns the paths written"""
+		with self.lock:
+			obj, d = self.read(bundle, id)
+			handler = HANDLERS.get(obj.type)
+			if handler is None:
+				raise ValueError("No handler for %s objects" % (obj.type))
+			options = Options()
+			sink = ListingSink(os.path.join(output, bundle))
+			handler.func(d if handler.read else obj, sink, options)
+			if handler.finish:
+				handler.finish(sink, options)
+			return sink.paths
+
+	def prefab(self, id, output, bundle=None, compact=False):
+		"""Export the prefab of the game object, returns its directory"""
+		if bundle is None:
+			self.ready.wait()
+			bundles = sorted(self.ids.get(id, ()))
+			if not bundles:
+				raise KeyError("No game object %i" % (id))
+			if len(bundles) > 1:
+				raise ValueError("%i is in several bundles (%s), pick one" % (id, ", ".join(bundles)))
+			bundle = bundles[0]
+		with self.lock:
+			obj, d = self.read(bundle, id)
+			if obj.type != "GameObject":
+				raise ValueError("%i is a %s, not a GameObject" % (id, obj.type))
+			os.makedirs(output, exist_ok=True)
+			return export_prefab(d, output, compact=compact)
+
+	def shader(self, bundle, id, output, raw=False):
+		"""Dump the shader as dump_shaders.py does, returns the paths written"""
+		with self.lock:
+			obj, d = self.read(bundle, id)
+			if obj.type != "Shader":
+				raise ValueError("%i is a %s, not a Shader" % (id, obj.type))
+			sink = ListingSink(output)
+			extract_shader(d, obj.type, raw, sink)
+			return sink.paths
+
+	def stats(self):
+		stats = {
+			"uptime": time.time() - self.started,
+			"bundles": len(self.files),
+			"loaded": sorted(self.bundles),
+			"indexed": self.ready.is_set(),
+			"names": len(self.index),
+			"cached objects": len(self.objects),
+			"cache hits": self.hits,
+			"cache misses": self.misses,
+		}
+		if metrics.METRICS.enabled:
+			stats["metrics"] = metrics.METRICS.to_dict()
+		return stats
+
+	def stop(self):
+		info("Stopping")
+		# from another thread, shutdown() waits for the request to finish
+		threading.Thread(target=self.server.shutdown).start()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+	"""A client connection, with any number of requests"""
+
+	def handle(self):
+		daemon = self.server.daemon
+		while True:
+			try:
+				message = receive(self.rfile)
+			except (ConnectionError, OSError):
+				return
+			started = time.perf_counter()
+			method = message.get("method")
+			try:
+				if method not in daemon.methods:
+					raise ValueError("Unknown method %r" % (method))
+				result = daemon.methods[method](**message.get("params", {}))
+				response = {"ok": True, "result": result}
+			except Exception as e:
+				error("%s failed (%r)", method, e, method=method)
+				response = {"ok": False, "error": str(e) or repr(e)}
+			response["ms"] = (time.perf_counter() - started) * 1000
+			debug("%s in %.1f ms", method, response["ms"], method=method)
+			utils.Echo.flush()
+			try:
+				send(self.wfile, response)
+			except OSError:
+				return
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, path, daemon):
+		# the socket is private from the start, before any chmod could be
+		umask = os.umask(0o077)
+		try:
+			super().__init__(path, DaemonHandler)
+		finally:
+			os.umask(umask)
+		self.daemon = daemon
+		daemon.server = self
+
+
+def socket_in_use(path):
+	"""If a daemon listens on path, the socket of one that is gone is removed
+
+	Raises ValueError when something else than a socket is at path.
+	"""
+	try:
+		mode = os.lstat(path).st_mode
+	except FileNotFoundError:
+		return False
+	if not stat.S_ISSOCK(mode):
+		raise ValueError("%s exists and is not a socket" % (path))
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		try:
+			sock.connect(path)
+		except OSError:
+			os.remove(path)
+			return False
+	return True
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("input",
+		help="the directory containing the unity3d files")
+	p.add_argument("--socket", default=DEFAULT_SOCKET,
+		help="the Unix socket to listen on")
+	p.add_argument("--cache",
+		help="the directory of the gameobject_search.py cache files")
+	p.add_argument("--object-cache", type=int, default=OBJECT_CACHE,
+		help="number of objects kept read")
+	cli.add_arguments(p)
+	args = cli.parse_args(p)
+
+	try:
+		in_use = socket_in_use(args.socket)
+	except ValueError as e:
+		error("%s", e)
+		sys.exit(1)
+	if in_use:
+		error("A daemon is already listening on %s", args.socket)
+		sys.exit(1)
+
+	redefine_shader()
+	if args.cache:
+		os.makedirs(args.cache, exist_ok=True)
+	daemon = Daemon(extract.find_bundles([args.input]), args.cache, args.object_cache)
+
+	with DaemonServer(args.socket, daemon) as server:
+		try:
+			threading.Thread(target=daemon.warm, daemon=True).start()
+			info("Listening on %s", args.socket)
+			utils.Echo.flush()
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			os.remove(args.socket)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Thin client for daemon.py, to look things up without loading anything
+
+Only imports the standard library, so a lookup costs the interpreter's
+startup and a round trip to the daemon:
+
+	daemon_client.py search sword
+	daemon_client.py extract cards0 4242 -o out
+	daemon_client.py prefab 4242 -o out
+	daemon_client.py shader shaders 17 -o out
+	daemon_client.py stats
+	daemon_client.py stop
+
+Requests and responses are json lines over a Unix socket:
+
+	{"method": "search", "params": {"term": "sword"}}
+	{"ok": true, "result": [...], "ms": 0.4}
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+
+# the daemon's socket, unless --socket or UNITYPACK_DAEMON is set
+DEFAULT_SOCKET = os.environ.get("UNITYPACK_DAEMON") or os.path.join(
+	tempfile.gettempdir(), "unitypack-scripts-%s.sock" % (getattr(os, "getuid", lambda: "")())
+)
+
+
+class DaemonError(Exception):
+	pass
+
+
+def send(f, message):
+	f.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+	f.flush()
+
+
+def receive(f):
+	line = f.readline()
+	if not line:
+		raise ConnectionError("connection closed")
+	return json.loads(line)
+
+
+def call(method, path=DEFAULT_SOCKET, **params):
+	"""The result of method on the daemon listening at path"""
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.connect(path)
+		with sock.makefile("rwb") as f:
+			send(f, {"method": method, "params": params})
+			response = receive(f)
+	if not response.get("ok"):
+		raise DaemonError(response.get("error"))
+	return response["result"]
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("--socket", default=DEFAULT_SOCKET,
+		help="the daemon's socket")
+	commands = p.add_subparsers(dest="command", required=True)
+
+	c = commands.add_parser("search", help="game objects with the term in their name")
+	c.add_argument("term", help="the search string, case insensitive")
+
+	c = commands.add_parser("extract", help="run the extract handler of an object")
+	c.add_argument("bundle")
+	c.add_argument("id", type=int)
+	c.add_argument("--output", "-o", required=True)
+
+	c = commands.add_parser("prefab", help="export the prefab a game object is part of")
+	c.add_argument("id", type=int)
+	c.add_argument("--bundle", help="the bundle of the game object, if the id isn't unique")
+	c.add_argument("--output", "-o", required=True)
+	c.add_argument("--compact", action="store_true")
+
+	c = commands.add_parser("shader", help="dump a shader and its subprograms")
+	c.add_argument("bundle")
+	c.add_argument("id", type=int)
+	c.add_argument("--output", "-o", required=True)
+	c.add_argument("--raw", action="store_true")
+
+	commands.add_parser("stats", help="what the daemon has loaded and cached")
+	commands.add_parser("stop", help="stop the daemon")
+	args = p.parse_args()
+
+	params = {k: v for k, v in vars(args).items() if k not in ("socket", "command")}
+	if params.get("output"):
+		# the daemon has its own working directory
+		params["output"] = os.path.abspath(params["output"])
+	try:
+		result = call(args.command, args.socket, **params)
+	except (ConnectionError, FileNotFoundError) as e:
+		print(f"Could not reach the daemon at {args.socket} ({e})", file=sys.stderr)
+		sys.exit(2)
+	except DaemonError as e:
+		print(f"Error: {e}", file=sys.stderr)
+		sys.exit(1)
+
+	if args.command == "search":
+		if result:
+			for r in result:
+				print(f"{r['id']:22} {r['bundle']:<16}{r['name']}")
+		else:
+			print(f"No Results for '{args.term.lower()}'")
+	elif args.command == "stats":
+		print(json.dumps(result, indent=4))
+	elif result:
+		print("\n".join(result) if isinstance(result, list) else result)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+
+"""Extract bundles on several hosts, from a coordinator's queue of tasks
+
+The coordinator plans the tasks as extract.py --jobs does (bundles, split
+in ranges of objects when large) and hands them out, largest first, to the
+workers that connect to it:
+
+	distributed.py coordinator bundles/ -o out --all --listen 0.0.0.0:7400 --token SECRET
+	distributed.py worker coordinator-host:7400 --token SECRET -o out --input /mnt/bundles
+
+Workers run the extract handlers on each task and report the objects done,
+which the coordinator records in its checkpoint (so --resume works as with
+extract.py). The task of a worker that fails or disconnects is handed out
+again, as is one that takes longer than --task-timeout. --local-workers N
+starts N workers on this machine, for testing.
+
+The coordinator only listens on localhost unless told otherwise, and the
+workers must send its token (--token, or UNITYPACK_TOKEN) before anything
+else. Workers write to their own --output and run their own
+--audio-encoder, they don't take either from the coordinator.
+
+The protocol is json lines over TCP, the worker asks and the coordinator
+replies:
+
+	{"op": "hello", "token": ...}             {"op": "config", ...}
+	{"op": "next"}                            {"op": "task", "id": ...}, "wait" or "done"
+	{"op": "result", "id": ..., "marks": ...} {"op": "ok"}
+	{"op": "failed", "id": ..., "error": ...} {"op": "ok"}
+"""
+
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from collections import deque
+from multiprocessing import Process
+
+import checkpoint
+import cli
+import extract
+import metrics
+import progress
+import scheduler
+import utils
+from handlers import grouped_types
+
+
+(debug, info, error) = utils.Echo.echo()
+
+DEFAULT_PORT = 7400
+
+# seconds a worker waits before asking again, while the last tasks run
+WAIT_INTERVAL = 1.0
+
+# times a task is handed out before it is given up on
+MAX_ATTEMPTS = 3
+
+# seconds a task may run before it is handed out again
+TASK_TIMEOUT = 3600.0
+
+# seconds between checks for tasks past their deadline
+TIMEOUT_CHECK = 5.0
+
+# extract.py options the workers take from their own command line
+WORKER_ARGS = ["audio_encoder"]
+
+
+def parse_address(address, host="localhost"):
+	"""(host, port) from host:port, :port or host"""
+	name, sep, port = address.rpartition(":")
+	if not sep:
+		return (address or host, DEFAULT_PORT)
+	return (name or host, int(port))
+
+
+def send(f, message):
+	f.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+	f.flush()
+
+
+def receive(f):
+	line = f.readline()
+	if not line:
+		raise ConnectionError("connection closed")
+	return json.loads(line)
+
+
+def extract_args(args):
+	"""The values of the extract.py handler options in args"""
+	return extract.option_values(args, exclude=WORKER_ARGS)
+
+
+class Coordinator:
+	"""The queue of tasks, and the bookkeeping of their results"""
+
+	def __init__(self, tasks, config, token, done=None, timeout=TASK_TIMEOUT):
+		self.config = config
+		self.token = token
+		self.timeout = timeout
+		self.done = done
+		self.lock = threading.Lock()
+		self.finished = threading.Event()
+		self.tasks = dict(enumerate(tasks))
+		# largest first, as scheduler.WorkQueues deals them
+		self.pending = deque(sorted(self.tasks, key=lambda id: -self.tasks[id].cost))
+		self.running = {}
+		self.attempts = {}
+		# bundles with a task given up on are left unfinished in the checkpoint
+		self.bundles_left = scheduler.BundleTracker(tasks, self.bundle_done)
+		if not tasks:
+			self.finished.set()
+
+	def bundle_done(self, name):
+		if self.done and name not in self.bundles_left.incomplete:
+			self.done.mark_bundle(name)
+		progress.bundle_done()
+
+	def next(self, worker):
+		"""The next task message for worker"""
+		with self.lock:
+			if self.pending:
+				id = self.pending.popleft()
+				task = self.tasks[id]
+				self.running[id] = (worker, time.monotonic() + self.timeout)
+				self.attempts[id] = self.attempts.get(id, 0) + 1
+				debug("%r to %s", task, worker, bundle=task.name, worker=worker)
+				return {
+					"op": "task", "id": id, "path": task.path, "cost": task.cost,
+					"objects": task.objects, "part": task.part, "parts": task.parts,
+				}
+			return {"op": "wait" if self.running else "done"}
+
+	def _complete(self, id, failed=False):
+		del self.running[id]
+		if failed:
+			self.bundles_left.task_failed(self.tasks[id])
+		else:
+			self.bundles_left.task_done(self.tasks[id])
+		if not self.pending and not self.running:
+			self.finished.set()
+
+	def _owns(self, id, worker):
+		return id in self.running and self.running[id][0] == worker
+
+	def authenticate(self, token):
+		return hmac.compare_digest(str(token).encode("utf-8"), self.token.encode("utf-8"))
+
+	def result(self, id, message, worker):
+		with self.lock:
+			# a late result, from a worker the task was taken back from
+			if not self._owns(id, worker):
+				return
+			task = self.tasks[id]
+			if self.done and not self.config["archive"]:
+				for asset, ids in message.get("marks", []):
+					self.done.mark_objects(task.name, asset, ids)
+			if metrics.METRICS.enabled and message.get("metrics"):
+				metrics.METRICS.merge(message["metrics"])
+			progress.update(message.get("bytes", 0), message.get("objects", 0))
+			self._complete(id)
+
+	def failed(self, id, reason, worker=None):
+		"""Hand the task out again, until it has failed MAX_ATTEMPTS times"""
+		with self.lock:
+			if id not in self.running or (worker and not self._owns(id, worker)):
+				return
+			task = self.tasks[id]
+			if self.attempts[id] < MAX_ATTEMPTS:
+				error("%r failed (%s), retrying", task, reason, bundle=task.name)
+				del self.running[id]
+				self.pending.appendleft(id)
+			else:
+				error("%r failed (%s), giving up", task, reason, bundle=task.name)
+				self._complete(id, failed=True)
+
+	def expire(self):
+		"""Take back the tasks past their deadline, from hung workers"""
+		now = time.monotonic()
+		with self.lock:
+			expired = [
+				(id, worker) for id, (worker, deadline) in self.running.items()
+				if deadline < now
+			]
+		for id, worker in expired:
+			self.failed(id, "timed out on %s" % (worker), worker)
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+	"""A worker connection"""
+
+	def handle(self):
+		coordinator = self.server.coordinator
+		worker = "%s:%i" % self.client_address[:2]
+		current = None
+		authenticated = False
+		try:
+			while True:
+				try:
+					message = receive(self.rfile)
+				except ConnectionError:
+					break
+				op = message.get("op")
+				if op == "hello":
+					if not coordinator.authenticate(message.get("token", "")):
+						error("Worker %s rejected, wrong token", worker, worker=worker)
+						send(self.wfile, {"op": "error", "error": "wrong token"})
+						break
+					authenticated = True
+					# the address keeps the names of workers unique
+					worker = "%s@%s" % (message.get("name") or "worker", worker)
+					info("Worker %s connected", worker, worker=worker)
+					send(self.wfile, dict(coordinator.config, op="config"))
+				elif not authenticated:
+					send(self.wfile, {"op": "error", "error": "hello first"})
+					break
+				elif op == "next":
+					reply = coordinator.next(worker)
+					current = reply.get("id")
+					send(self.wfile, reply)
+				elif op == "result":
+					coordinator.result(message["id"], message, worker)
+					current = None
+					send(self.wfile, {"op": "ok"})
+				elif op == "failed":
+					coordinator.failed(message["id"], message.get("error"), worker)
+					current = None
+					send(self.wfile, {"op": "ok"})
+				else:
+					send(self.wfile, {"op": "error", "error": "unknown op %r" % (op)})
+		except OSError as e:
+			error("Worker %s lost (%s)", worker, e, worker=worker)
+		finally:
+			if current is not None:
+				coordinator.failed(current, "worker %s disconnected" % (worker), worker)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, coordinator):
+		super().__init__(address, CoordinatorHandler)
+		self.coordinator = coordinator
+
+
+class Tally:
+	"""Counts a task's objects in a worker, for the coordinator's progress"""
+
+	def __init__(self):
+		self.objects = 0
+		self.bytes = 0
+
+	def update(self, size=0, objects=1):
+		self.objects += objects
+		self.bytes += size
+
+	def bundle_done(self, bundles=1):
+		pass
+
+
+def run_task(task, config, output, options):
+	"""Extract a task, return its result message"""
+	metrics.METRICS.reset()
+	tally = progress.REPORTER = Tally()
+	try:
+		recorder = extract.extract_task(
+			task, output, config["archive"], set(config["formats"]), options
+		)
+	finally:
+		progress.REPORTER = None
+	utils.Echo.flush()
+	return {
+		"op": "result",
+		"marks": recorder.marks,
+		"objects": tally.objects,
+		"bytes": tally.bytes,
+		"metrics": metrics.METRICS.to_dict() if metrics.METRICS.enabled else None,
+	}
+
+
+def run_worker(address, token, output, input_dir=None, name=None, audio_encoder=None):
+	"""Run the tasks of the coordinator at address, until there are none left
+
+	input_dir is where this host has the bundles, when not at the paths
+	the coordinator has them.
+	"""
+	name = name or "%s-%i" % (socket.gethostname(), os.getpid())
+	with socket.create_connection(address) as sock, sock.makefile("rwb") as f:
+		send(f, {"op": "hello", "name": name, "token": token})
+		config = receive(f)
+		if config["op"] != "config":
+			raise ConnectionError(config.get("error"))
+		metrics.METRICS.enabled = config["stats"]
+		options = extract.get_options(
+			Namespace(**dict(config["args"], audio_encoder=audio_encoder))
+		)
+		while True:
+			send(f, {"op": "next"})
+			message = receive(f)
+			if message["op"] == "done":
+				break
+			if message["op"] == "wait":
+				time.sleep(WAIT_INTERVAL)
+				continue
+			path = message["path"]
+			if input_dir:
+				path = os.path.join(input_dir, os.path.basename(path))
+			task = scheduler.Task(
+				path, message["cost"], message["objects"], message["part"], message["parts"]
+			)
+			try:
+				# the handlers keep their pending work in the options
+				options.pending.clear()
+				result = run_task(task, config, output, options)
+			except Exception as e:
+				error("Error: %r %s", task, e, bundle=task.name)
+				result = {"op": "failed", "error": str(e)}
+			result["id"] = message["id"]
+			send(f, result)
+			receive(f)
+
+
+def coordinate(args):
+	files = [
+		f for f in extract.find_bundles(args.files)
+		if utils.filename_no_ext(f) not in extract.EXCLUDES
+	]
+	handle_formats = extract.get_formats(args)
+
+	run_options = extract.option_values(args, exclude=["threads"])
+	with checkpoint.open_checkpoint(args, args.output, "extract", run_options) as done:
+		bundles = []
+		for f in files:
+			bundle_name = utils.filename_no_ext(f)
+			if done.bundle_done(bundle_name):
+				info("Skipping %s (done)...", bundle_name, bundle=bundle_name)
+			else:
+				bundles.append(f)
+
+		workers = max(args.expected_workers + args.local_workers, 1)
+		# archives need a single writer, and are rewritten as a whole
+		tasks = scheduler.plan(
+			[os.path.abspath(f) for f in bundles], workers, handle_formats,
+			split_bundles=not args.archive, done=None if args.archive else done,
+			whole_types=grouped_types(handle_formats)
+		)
+		if args.progress:
+			progress.start(scheduler.totals(tasks) or progress.count_objects(
+				bundles, handle_formats, None if args.archive else done
+			))
+		config = {
+			"archive": args.archive,
+			"formats": sorted(handle_formats),
+			"args": extract_args(args),
+			"stats": metrics.METRICS.enabled,
+		}
+		token = args.token
+		if not token:
+			token = secrets.token_urlsafe(16)
+			info("Workers must connect with --token %s", token)
+		coordinator = Coordinator(tasks, config, token, done, args.task_timeout)
+		server = CoordinatorServer(parse_address(args.listen), coordinator)
+		host, port = server.server_address[:2]
+		info("Coordinating %i tasks on %s:%i", len(tasks), host, port, tasks=len(tasks))
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+
+		# don't let the local workers inherit, and repeat, buffered messages
+		utils.Echo.flush()
+		local = [
+			Process(
+				target=run_worker,
+				args=(("localhost", port), token, args.output),
+				kwargs={"audio_encoder": args.audio_encoder}, daemon=True
+			)
+			for i in range(args.local_workers)
+		]
+		for process in local:
+			process.start()
+		while not coordinator.finished.wait(TIMEOUT_CHECK):
+			coordinator.expire()
+		for process in local:
+			process.join()
+		server.shutdown()
+		server.server_close()
+		coordinator.bundles_left.report()
+
+	progress.finish()
+
+
+def main():
+	p = ArgumentParser()
+	commands = p.add_subparsers(dest="command", required=True)
+
+	c = commands.add_parser("coordinator", help="hand out the tasks and record the results")
+	c.add_argument("files", nargs="+")
+	c.add_argument("--output", "-o", required=True)
+	c.add_argument("--listen", default="localhost:%i" % (DEFAULT_PORT),
+		help="[host]:port to listen on, port 0 picks a free one")
+	c.add_argument("--token", default=os.environ.get("UNITYPACK_TOKEN"),
+		help="the workers' shared secret, a random one is made by default")
+	c.add_argument("--task-timeout", type=float, default=TASK_TIMEOUT,
+		help="seconds before the task of a hung worker is handed out again")
+	c.add_argument("--local-workers", type=int, default=0,
+		help="number of workers to start on this machine")
+	c.add_argument("--expected-workers", type=int, default=0,
+		help="workers on other hosts, the bundles are split for them too")
+	extract.add_arguments(c)
+	checkpoint.add_arguments(c)
+	cli.add_arguments(c, progress=True)
+
+	w = commands.add_parser("worker", help="run the tasks of a coordinator")
+	w.add_argument("address", help="host:port of the coordinator")
+	w.add_argument("--output", "-o", required=True)
+	w.add_argument("--token", default=os.environ.get("UNITYPACK_TOKEN"),
+		help="the coordinator's token")
+	w.add_argument("--input",
+		help="directory with the bundles on this host, by default the coordinator's paths")
+	w.add_argument("--name", help="name of the worker in the coordinator's messages")
+	# transcode audio with a local command, never one from the coordinator
+	w.add_argument("--audio-encoder",
+		help="'fsb5' or a command, e.g. \"vgmstream-cli -o {output} {input}\"")
+	cli.add_arguments(w)
+
+	args = cli.parse_args(p)
+	if args.command == "coordinator":
+		coordinate(args)
+	else:
+		if not args.token:
+			p.error("the worker needs the coordinator's --token")
+		run_worker(
+			parse_address(args.address), args.token, args.output,
+			args.input, args.name, args.audio_encoder
+		)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""Compare two versions of the client, object by object
+
+Either side can be a directory of yaml or jsonl dumps created by dump_yaml.py,
+or a directory of unity3d bundles. Each object is hashed first and only those
+with differing hashes are deserialized and compared field by field.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+from argparse import ArgumentParser
+
+import yaml
+
+import cli
+import dump_yaml
+import metrics
+from utils import Echo, filename_no_ext, read_asset_data
+
+
+(debug, info, error) = Echo.echo()
+
+# the id leading a dump_yaml.serialize_json record
+RECORD_ID = re.compile(rb'\{"id":(-?\d+),')
+
+
+def content_hash(data):
+	return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def pointer_constructor(loader, node):
+	# as dump_yaml.json_default writes them, for yaml and json to compare equal
+	return {"PPtr": loader.construct_sequence(node)}
+
+
+def yaml_loader():
+	"""dump_yaml's Loader, once registered, with the pointers loaded as in json"""
+	class PointerLoader(dump_yaml.Loader):
+		pass
+	PointerLoader.add_constructor("!PPtr", pointer_constructor)
+	return PointerLoader
+
+
+class YamlDump:
+	"""A dump_yaml.py output directory, a yaml file per object"""
+	kind = "yaml"
+
+	def __init__(self, path):
+		self.entries = {}
+		self.loader = yaml_loader()
+		for bundle_dir in sorted(glob.glob(os.path.join(path, "*", ""))):
+			bundle = os.path.basename(os.path.dirname(bundle_dir))
+			for f in glob.glob(os.path.join(bundle_dir, "*.yaml")):
+				with open(f, "rb") as fin:
+					digest = content_hash(fin.read())
+				self.entries[(bundle, filename_no_ext(f))] = (digest, f)
+
+	def load(self, key):
+		with open(self.entries[key][1], encoding="utf-8") as f:
+			return yaml.load(f.read(), Loader=self.loader)
+
+	def close(self):
+		pass
+
+
+class JsonlDump:
+	"""A dump_yaml.py --format jsonl output directory, a file per bundle (or part)"""
+	kind = "jsonl"
+
+	def __init__(self, path):
+		self.entries = {}
+		for f in sorted(glob.glob(os.path.join(path, "*.jsonl"))):
+			bundle = dump_yaml.jsonl_bundle(f)
+			with open(f, "rb") as fin:
+				offset = 0
+				for line in fin:
+					if line.strip():
+						# only the id is needed, without parsing the whole record
+						match = RECORD_ID.match(line)
+						if match:
+							id = match.group(1).decode("ascii")
+						else:
+							id = str(json.loads(line)["id"])
+						self.entries[(bundle, id)] = (content_hash(line), (f, offset))
+					offset += len(line)
+
+	def load(self, key):
+		f, offset = self.entries[key][1]
+		with open(f, "rb") as fin:
+			fin.seek(offset)
+			return json.loads(fin.readline())["data"]
+
+	def close(self):
+		pass
+
+
+class BundleSource:
+	"""A directory of unity3d bundles, hashing the raw object data"""
+	kind = "bundle"
+
+	def __init__(self, path):
+		import unitypack
+
+		self.entries = {}
+		self.files = []
+		if os.path.isdir(path):
+			files = sorted(glob.glob(os.path.join(path, "*.unity3d")))
+		else:
+			files = [path]
+		for file in files:
+			bundle_name = filename_no_ext(file)
+			f = open(file, "rb")
+			self.files.append(f)
+			with metrics.timer("load"):
+				bundle = unitypack.load(f)
+			for asset in bundle.assets:
+				for id, obj in asset.objects.items():
+					with metrics.timer("read"):
+						digest = content_hash(read_asset_data(obj.asset, obj.data_offset, obj.size))
+					self.entries[(bundle_name, str(id))] = (digest, obj)
+
+	def load(self, key):
+		obj = self.entries[key][1]
+		# round trip through json, to strip the objects like the dumps
+		return json.loads(json.dumps(obj.read(), default=dump_yaml.json_default))
+
+	def close(self):
+		for f in self.files:
+			f.close()
+
+
+def open_source(path):
+	if os.path.isdir(path):
+		if glob.glob(os.path.join(path, "*.jsonl")):
+			return JsonlDump(path)
+		if glob.glob(os.path.join(path, "*.unity3d")):
+			return BundleSource(path)
+		return YamlDump(path)
+	return BundleSource(path)
+
+
+def diff_values(old, new, path=""):
+	"""Yield (change, path, old, new) for every differing field"""
+	if isinstance(old, dict) and isinstance(new, dict):
+		for k, v in old.items():
+			sub = f"{path}.{k}" if path else str(k)
+			if k not in new:
+				yield ("-", sub, v, None)
+			else:
+				yield from diff_values(v, new[k], sub)
+		for k, v in new.items():
+			if k not in old:
+				sub = f"{path}.{k}" if path else str(k)
+				yield ("+", sub, None, v)
+	elif isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+		for i in range(max(len(old), len(new))):
+			sub = f"{path}[{i}]"
+			if i >= len(new):
+				yield ("-", sub, old[i], None)
+			elif i >= len(old):
+				yield ("+", sub, None, new[i])
+			else:
+				yield from diff_values(old[i], new[i], sub)
+	elif old != new:
+		yield ("~", path, old, new)
+
+
+def diff(old, new):
+	"""Yield (change, key, fields) for each added, removed or changed object"""
+	# hashes are only comparable between sources of the same kind
+	compare_hashes = old.kind == new.kind
+	for key in sorted(old.entries.keys() | new.entries.keys()):
+		if key not in new.entries:
+			yield ("-", key, [])
+		elif key not in old.entries:
+			yield ("+", key, [])
+		elif not compare_hashes or old.entries[key][0] != new.entries[key][0]:
+			fields = list(diff_values(old.load(key), new.load(key)))
+			if fields:
+				yield ("~", key, fields)
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("old", help="dump directory or bundles of the old version")
+	p.add_argument("new", help="dump directory or bundles of the new version")
+	p.add_argument("--json", action="store_true",
+		help="output a json record per changed object")
+	p.add_argument("--objects-only", action="store_true",
+		help="only list the changed objects, not their fields")
+	cli.add_arguments(p)
+	args = cli.parse_args(p)
+
+	dump_yaml.register_yaml()
+
+	info("Indexing %s", args.old)
+	old = open_source(args.old)
+	info("Indexing %s", args.new)
+	new = open_source(args.new)
+	info("Comparing %i and %i objects", len(old.entries), len(new.entries))
+
+	try:
+		for change, (bundle, id), fields in diff(old, new):
+			if args.json:
+				record = {"change": change, "bundle": bundle, "id": id}
+				if not args.objects_only:
+					record["fields"] = [
+						{"change": c, "path": path, "old": o, "new": n}
+						for c, path, o, n in fields
+					]
+				print(json.dumps(record, default=repr))
+				continue
+			print(f"{change} {bundle}/{id}")
+			if args.objects_only:
+				continue
+			for c, path, o, n in fields:
+				if c == "+":
+					print(f"\t+ {path}: {n!r}")
+				elif c == "-":
+					print(f"\t- {path}: {o!r}")
+				else:
+					print(f"\t~ {path}: {o!r} -> {n!r}")
+	finally:
+		old.close()
+		new.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -4,32 +4,114 @@
 
 import os
 import pickle
-import sys
 import glob
 import unitypack
+import checkpoint
+import cli
+import metrics
+import progress
+import scheduler
 import utils
 from unitypack.export import OBJMesh
 from argparse import ArgumentParser
+from functools import partial
 from io import BytesIO
 from shaders import extract_shader, redefine_shader
+from sinks import ARCHIVE_FORMATS, open_sink
 
 
 (debug, info, error) = utils.Echo.echo()
 
 
+def dump_asset(asset, sink, bundle_name, args, done=None, ids=None):
+	"""Dump the shaders of asset, or only those in ids
+
+	With a BundleCheckpoint, shaders already done are skipped and each one
+	dumped is recorded.
+	"""
+	if ids is None:
+		ids = asset.objects.keys()
+	if done:
+		ids = done.pending(asset, ids)
+	for id in ids:
+		obj = asset.objects[id]
+		try:
+			if obj.type == "Shader":
+				with metrics.timer("read"):
+					d = obj.read()
+				metrics.count("objects")
+				if not args.only or (args.only and args.only in d.parsed_form.name):
+					extract_shader(d, obj.type, args.raw, sink)
+				progress.update(obj.size)
+				if done:
+					done.mark(asset, [id])
+		except Exception as e:
+			error("%s (%s)", e, bundle_name, bundle=bundle_name)
+			if args.trace:
+				raise
+
+
+def dump_task(task, args):
+	"""Dump the shaders of a scheduler Task, in a worker
+
+	Returns the Recorder of the shaders done, for the parent's checkpoint.
+	"""
+	info("Processing %s [%i/%i]", task.path, task.part + 1, task.parts, bundle=task.name)
+	recorder = checkpoint.Recorder()
+	with open(task.path, "rb") as f, cli.bundle(task.name):
+		with metrics.timer("load"):
+			bundle = unitypack.load(f)
+
+		with open_sink(args.output, task.name, args.archive) as sink:
+			for asset, ids in scheduler.task_assets(bundle, task):
+				dump_asset(asset, sink, task.name, args, recorder, ids)
+	return recorder
+
+
+def dump_parallel(files, args, done):
+	"""Dump the shaders of files with the scheduler, in args.jobs workers"""
+	# archives need a single writer, and are rewritten as a whole
+	tasks = scheduler.plan(
+		files, args.jobs, ["Shader"],
+		split_bundles=not args.archive, done=None if args.archive else done
+	)
+	if args.progress:
+		progress.start(scheduler.totals(tasks) or progress.count_objects(
+			files, ["Shader"], None if args.archive else done
+		))
+
+	def bundle_done(name):
+		if name not in bundles_left.incomplete:
+			done.mark_bundle(name)
+		progress.bundle_done()
+
+	bundles_left = scheduler.BundleTracker(tasks, bundle_done)
+
+	def task_done(task, recorder):
+		if not args.archive:
+			recorder.apply(done, task.name)
+		bundles_left.task_done(task)
+
+	scheduler.run(
+		tasks, partial(dump_task, args=args), args.jobs,
+		setup=redefine_shader, on_result=task_done, on_error=bundles_left.task_failed
+	)
+	bundles_left.report()
+
+
 def main():
 	p = ArgumentParser()
 	p.add_argument("input")
 	p.add_argument("output")
 	p.add_argument("--only")
 	p.add_argument("--raw", action="store_true")
-	p.add_argument("-qq", action="store_true")
-	p.add_argument("-q", action="store_true")
 	p.add_argument("--trace", action="store_true")
-	args = p.parse_args(sys.argv[1:])
-
-	utils.Echo.quiet = args.q
-	utils.Echo.very_quiet = args.qq
+	# write one archive per bundle, instead of a file per object
+	p.add_argument("--archive", choices=ARCHIVE_FORMATS)
+	scheduler.add_argument(p)
+	checkpoint.add_arguments(p)
+	cli.add_arguments(p, progress=True)
+	args = cli.parse_args(p)
 
 	files = [args.input]
 	if os.path.isdir(args.input):
@@ -37,29 +119,42 @@ def main():
 
 	redefine_shader()
 
-	for file in files:
-		info("Processing %s" % (file))
-
-		with open(file, "rb") as f:
-			bundle = unitypack.load(f)
+	run_options = {"only": args.only, "raw": args.raw, "archive": args.archive}
+	with checkpoint.open_checkpoint(args, args.output, "dump_shaders", run_options) as done:
+		bundles = []
+		for file in files:
+			bundle_name = utils.filename_no_ext(file)
+			if done.bundle_done(bundle_name):
+				info("Skipping %s (done)", file, bundle=bundle_name)
+			else:
+				bundles.append(file)
 
-		for asset in bundle.assets:
-			for id, obj in asset.objects.items():
+		if args.jobs > 1:
+			dump_parallel(bundles, args, done)
+		else:
+			if args.progress:
+				# an archive is rewritten as a whole, its objects are all counted
+				progress.start(progress.count_objects(
+					bundles, ["Shader"], None if args.archive else done
+				))
+			for file in bundles:
 				bundle_name = utils.filename_no_ext(file)
-				try:
-					if obj.type == "Shader":
-						d = obj.read()
-						if not args.only or (args.only and args.only in d.parsed_form.name):
-							save_path = os.path.join(
-								args.output,
-								bundle_name,
-								obj.type
-							)
-							extract_shader(d, save_path, args.raw)
-				except Exception as e:
-					error("{0} ({1})".format(e, bundle_name))
-					if args.trace:
-						raise
+				info("Processing %s", file, bundle=bundle_name)
+				# an archive is rewritten as a whole, only skip finished bundles
+				scope = done.scope(bundle_name) if not args.archive else None
+
+				with open(file, "rb") as f, cli.bundle(bundle_name):
+					with metrics.timer("load"):
+						bundle = unitypack.load(f)
+
+					with open_sink(args.output, bundle_name, args.archive) as sink:
+						for asset in bundle.assets:
+							dump_asset(asset, sink, bundle_name, args, scope)
+				done.mark_bundle(bundle_name)
+				progress.bundle_done()
+
+	progress.finish()
+
 
 if __name__ == "__main__":
 	main()
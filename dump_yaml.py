@@ -1,20 +1,35 @@
 #!/usr/bin/env python
 
-"""Dump all contents of all unity3d files in dir as yaml
+"""Dump all contents of all unity3d files in dir as yaml (or json lines)
 
 Based on UnityPack's unity2yaml script
 """
 
 import os
-import sys
+import re
 import glob
+import json
 import yaml
 import unitypack
-import unitypack
 import unitypack.engine as engine
+from argparse import ArgumentParser
+from base64 import b64encode
+from functools import partial
 from unitypack.object import ObjectPointer
 from unitypack.asset import Asset
+import cli
+import metrics
+import progress
+import scheduler
+import utils
 from utils import *
+from sinks import ARCHIVE_FORMATS, DirectorySink, open_sink
+
+# use the libyaml emitter and parser when available
+try:
+	from yaml import CDumper as Dumper, CLoader as Loader
+except ImportError:
+	from yaml import Dumper, Loader
 
 
 FILE_EXT = ".unity3d"
@@ -43,104 +58,261 @@ def objectpointer_constructor(loader, node):
 	return loader.construct_sequence(node)
 
 
-def shader_representer(dumper, data):
+def strip_shader(data):
 	obj = data._obj.copy()
 	if "compressedBlob" in obj:
 		obj["compressedBlob"] = "<stripped>"
-	return dumper.represent_mapping("!unitypack:stripped:Shader", obj)
+	return obj
+
+
+def strip_name(data):
+	return {data.name: None}
+
+
+def strip_mesh(data):
+	obj = data._obj.copy()
+	obj["m_IndexBuffer"] = "<stripped>"
+	obj["m_VertexData"] = "<stripped>"
+	return obj
+
+
+def strip_movietexture(data):
+	obj = data._obj.copy()
+	obj["m_MovieData"] = "<stripped>"
+	return obj
+
+
+def shader_representer(dumper, data):
+	return dumper.represent_mapping("!unitypack:stripped:Shader", strip_shader(data))
 
 
 def textasset_representer(dumper, data):
-	return dumper.represent_mapping("!unitypack:stripped:TextAsset", {data.name: None})
+	return dumper.represent_mapping("!unitypack:stripped:TextAsset", strip_name(data))
 
 
 def texture2d_representer(dumper, data):
-	return dumper.represent_mapping("!unitypack:stripped:Texture2D", {data.name: None})
+	return dumper.represent_mapping("!unitypack:stripped:Texture2D", strip_name(data))
 
 
 def mesh_representer(dumper, data):
-	obj = data._obj.copy()
-	obj["m_IndexBuffer"] = "<stripped>"
-	obj["m_VertexData"] = "<stripped>"
-	return dumper.represent_mapping("!unitypack:stripped:Mesh", obj)
+	return dumper.represent_mapping("!unitypack:stripped:Mesh", strip_mesh(data))
 
 
 def movietexture_representer(dumper, data):
-	obj = data._obj.copy()
-	obj["m_MovieData"] = "<stripped>"
-	return dumper.represent_mapping("!unitypack:stripped:MovieTexture", obj)
+	return dumper.represent_mapping("!unitypack:stripped:MovieTexture", strip_movietexture(data))
+
+
+# objects with large binary fields, mapped to their stripped versions
+STRIPPED = {
+	engine.text.TextAsset: strip_name,
+	engine.mesh.Mesh: strip_mesh,
+	engine.movie.MovieTexture: strip_movietexture,
+	engine.text.Shader: strip_shader,
+	engine.texture.Texture2D: strip_name,
+}
+
+
+def json_default(obj):
+	"""Convert the objects the json encoder can't handle, as the representers do"""
+	if type(obj) in STRIPPED:
+		return STRIPPED[type(obj)](obj)
+	elif isinstance(obj, engine.object.Object):
+		return obj._obj
+	elif isinstance(obj, ObjectPointer):
+		return {"PPtr": [obj.file_id, obj.path_id]}
+	elif isinstance(obj, Asset):
+		return obj.name
+	elif isinstance(obj, bytes):
+		return b64encode(obj).decode("ascii")
+	raise TypeError(f"{obj!r} is not JSON serializable")
+
+
+def serialize_json(id, otype, obj):
+	"""A single line json record for the object"""
+	record = {"id": id, "type": otype, "data": obj}
+	return json.dumps(
+		record, default=json_default, ensure_ascii=False, separators=(",", ":")
+	)
+
+
+# the suffix of the jsonl files of a bundle split between tasks
+JSONL_PART = re.compile(r"\.part\d+$")
+
+
+def jsonl_name(bundle_name, task=None):
+	"""The jsonl file of the bundle, or of its part when split between tasks"""
+	if task is not None and task.parts > 1:
+		return f"{bundle_name}.part{task.part}.jsonl"
+	return bundle_name + ".jsonl"
+
+
+def jsonl_bundle(path):
+	"""The name of the bundle a jsonl file (or part) is of"""
+	return JSONL_PART.sub("", filename_no_ext(path))
+
+
+def read_jsonl(f):
+	"""Iterate the records of a json lines dump"""
+	with open(f, encoding="utf-8") as fin:
+		for line in fin:
+			if line.strip():
+				yield json.loads(line)
 
 
 def serialize(obj):
-	return yaml.dump(obj)
+	return yaml.dump(obj, Dumper=Dumper)
 
 
 def deserialize(obj):
-	return yaml.load(obj)
+	return yaml.load(obj, Loader=Loader)
 
 
 def mapping_constructor(loader, node):
 	return loader.construct_mapping(node)
 
 
-def main():
-	if len(sys.argv) != 3:
-		error("Usage: extract_yaml.py <dir_in> <dir_out>")
-		sys.exit(2)
+def add_representer(data_type, representer):
+	# register on the pure python dumper as well, in case it is used directly
+	for dumper in set((yaml.Dumper, Dumper)):
+		yaml.add_representer(data_type, representer, Dumper=dumper)
 
-	dir_in = sys.argv[1]
-	dir_out = sys.argv[2]
 
-	if os.path.isdir(dir_in):
-		files = glob.glob(dir_in + "/*")
-	else:
-		files = [dir_in]
+def add_constructor(tag, constructor):
+	for loader in set((yaml.Loader, Loader)):
+		yaml.add_constructor(tag, constructor, Loader=loader)
+
 
+def register_yaml():
+	"""Add the representers and constructors for unitypack objects"""
 	# define default representers and constructors for unity engine objects
 	for k, v in engine.__dict__.items():
 		if isinstance(v, type) and issubclass(v, engine.object.Object):
-			yaml.add_representer(v, unityobj_representer)
-			yaml.add_constructor("!unitypack:%s" % (k), mapping_constructor)
+			add_representer(v, unityobj_representer)
+			add_constructor("!unitypack:%s" % (k), mapping_constructor)
 	# define for non engine objects
-	yaml.add_representer(Asset, asset_representer)
-	yaml.add_representer(ObjectPointer, objectpointer_representer)
+	add_representer(Asset, asset_representer)
+	add_representer(ObjectPointer, objectpointer_representer)
 	# override set representer with stripped versions, for these objects
-	yaml.add_representer(engine.text.TextAsset, textasset_representer)
-	yaml.add_representer(engine.mesh.Mesh, mesh_representer)
-	yaml.add_representer(engine.movie.MovieTexture, movietexture_representer)
-	yaml.add_representer(engine.text.Shader, shader_representer)
-	yaml.add_representer(engine.texture.Texture2D, texture2d_representer)
+	add_representer(engine.text.TextAsset, textasset_representer)
+	add_representer(engine.mesh.Mesh, mesh_representer)
+	add_representer(engine.movie.MovieTexture, movietexture_representer)
+	add_representer(engine.text.Shader, shader_representer)
+	add_representer(engine.texture.Texture2D, texture2d_representer)
 	# constructors
-	yaml.add_constructor("!asset", asset_constructor)
-	yaml.add_constructor("!PPtr", objectpointer_constructor)
+	add_constructor("!asset", asset_constructor)
+	add_constructor("!PPtr", objectpointer_constructor)
 	# stripped versions
-	yaml.add_constructor("!unitypack:stripped:TextAsset", mapping_constructor)
-	yaml.add_constructor("!unitypack:stripped:Mesh", mapping_constructor)
-	yaml.add_constructor("!unitypack:stripped:MovieTexture", mapping_constructor)
-	yaml.add_constructor("!unitypack:stripped:Shader", mapping_constructor)
-	yaml.add_constructor("!unitypack:stripped:Texture2D", mapping_constructor)
+	add_constructor("!unitypack:stripped:TextAsset", mapping_constructor)
+	add_constructor("!unitypack:stripped:Mesh", mapping_constructor)
+	add_constructor("!unitypack:stripped:MovieTexture", mapping_constructor)
+	add_constructor("!unitypack:stripped:Shader", mapping_constructor)
+	add_constructor("!unitypack:stripped:Texture2D", mapping_constructor)
 
-	for f in files:
-		bundle_name = filename_no_ext(f)
-		if bundle_name in EXCLUDES:
-			info(f"Skipping {bundle_name}")
-			continue
-		else:
-			out_path = os.path.join(dir_out, bundle_name)
-			info(f"Extracting {bundle_name}")
 
-		with open(f, "rb") as fin:
+def iter_task(bundle, task=None):
+	"""The objects of the bundle, or only those of a scheduler Task"""
+	if task is None:
+		for asset in bundle.assets:
+			yield from iter_objects(asset)
+		return
+	for asset, ids in scheduler.task_assets(bundle, task):
+		yield from iter_objects(asset, ids=ids)
+
+
+def dump_bundle(f, dir_out, archive=None, format="yaml", task=None):
+	"""Dump every object in the bundle f, or only those of the given task"""
+	bundle_name = filename_no_ext(f)
+	split = task is not None and task.parts > 1
+	if split:
+		info("Extracting %s [%i/%i]", bundle_name, task.part + 1, task.parts, bundle=bundle_name)
+	else:
+		info("Extracting %s", bundle_name, bundle=bundle_name)
+
+	with open(f, "rb") as fin, cli.bundle(bundle_name):
+		with metrics.timer("load"):
 			bundle = unitypack.load(fin)
 
-		for asset in bundle.assets:
-			for id, obj in asset.objects.items():
+		if format == "jsonl":
+			# a single file per bundle (or part), next to the bundle dirs
+			sink = open_sink(dir_out, bundle_name, archive) if archive else DirectorySink(dir_out)
+			with sink, sink.open(jsonl_name(bundle_name, task), "w") as fout:
+				for id, otype, d in iter_task(bundle, task):
+					try:
+						with metrics.timer("encode"):
+							line = serialize_json(id, otype, d) + "\n"
+						with metrics.timer("write"):
+							fout.write(line)
+					except Exception as e:
+						error("Error: %s", e, id=id)
+			return
+
+		with open_sink(dir_out, bundle_name, archive) as sink:
+			for id, otype, d in iter_task(bundle, task):
 				try:
-					d = obj.read()
-					file_out = os.path.join(out_path, str(id) + ".yaml")
-					make_dirs(file_out)
-					write_to_file(file_out, serialize(d), warn=False)
+					with metrics.timer("encode"):
+						text = serialize(d)
+					sink.write(str(id) + ".yaml", text)
 				except Exception as e:
-					error(f"Error: {e}")
+					error("Error: %s", e, id=id)
+
+
+def dump_task(task, dir_out, archive, format):
+	dump_bundle(task.path, dir_out, archive, format, task)
+
+
+def main():
+	p = ArgumentParser()
+	p.add_argument("dir_in")
+	p.add_argument("dir_out")
+	# write one archive per bundle, instead of a file per object
+	p.add_argument("--archive", choices=ARCHIVE_FORMATS)
+	scheduler.add_argument(p)
+	p.add_argument("--format", choices=["yaml", "jsonl"], default="yaml",
+		help="a yaml file per object, or a json lines file per bundle")
+	cli.add_arguments(p, progress=True)
+	args = cli.parse_args(p)
+
+	dir_in = args.dir_in
+	dir_out = args.dir_out
+
+	if os.path.isdir(dir_in):
+		files = glob.glob(dir_in + "/*")
+	else:
+		files = [dir_in]
+
+	register_yaml()
+
+	bundles = []
+	for f in files:
+		bundle_name = filename_no_ext(f)
+		if bundle_name in EXCLUDES:
+			info("Skipping %s", bundle_name, bundle=bundle_name)
+		else:
+			bundles.append(f)
+
+	if args.jobs <= 1:
+		if args.progress:
+			progress.start(progress.count_objects(bundles))
+		for f in bundles:
+			dump_bundle(f, dir_out, args.archive, format=args.format)
+			progress.bundle_done()
+		progress.finish()
+		return
+
+	# archives need a single writer per bundle, the others are split
+	tasks = scheduler.plan(bundles, args.jobs, split_bundles=not args.archive)
+	if args.progress:
+		progress.start(scheduler.totals(tasks) or progress.count_objects(bundles))
+	bundles_left = scheduler.BundleTracker(tasks, lambda name: progress.bundle_done())
+	scheduler.run(
+		tasks,
+		partial(dump_task, dir_out=dir_out, archive=args.archive, format=args.format),
+		args.jobs, setup=register_yaml,
+		on_result=lambda task, result: bundles_left.task_done(task),
+		on_error=bundles_left.task_failed
+	)
+	bundles_left.report()
+	progress.finish()
 
 
 if __name__ == "__main__":
@@ -3,125 +3,260 @@
 """Base on UnityPack's unityextract script"""
 
 import os
-import pickle
-import sys
 import glob
 import unitypack
-from unitypack.export import OBJMesh
 from argparse import ArgumentParser
-from PIL import ImageOps
+from functools import partial
+import checkpoint
+import cli
+import metrics
+import progress
+import scheduler
 import utils
-from meshes import JSONMesh, BabylonMesh
+from handlers import HANDLERS, Options, get_handlers, grouped_types
+from sinks import ARCHIVE_FORMATS, open_sink
 
 
-EXCLUDES = ["sounds0"]
+EXCLUDES = []
+
+# objects recorded in the checkpoint at a time
+CHECKPOINT_BATCH = 64
 
 
 (debug, info, error) = utils.Echo.echo()
 
 
-def handle_asset(asset, handle_formats, dir, flip, objMesh):
-	for id, obj in asset.objects.items():
+def handle_asset(asset, handle_formats, sink, options, done=None, ids=None):
+	"""Run the handlers on the objects of asset, or only those in ids
+
+	With a BundleCheckpoint, objects already done are skipped and those
+	handled are recorded, after their handler's finish function if any.
+	"""
+	handlers = get_handlers(handle_formats)
+	if done:
+		ids = done.pending(asset, asset.objects.keys() if ids is None else ids)
+	finished = []
+	deferred = []
+	# only read objects when the handler asks for it
+	for id, otype, obj in utils.iter_objects(asset, handlers, ids=ids, read=False):
+		handler = handlers[otype]
+		if handler.read:
+			try:
+				with metrics.timer("read"):
+					d = obj.read()
+				metrics.count("objects")
+			except Exception as e:
+				error("[Error] %s", e, id=id)
+				continue
+		else:
+			d = obj
 		try:
-			otype = obj.type
+			handler.func(d, sink, options)
 		except Exception as e:
-			error("[Error] %s" % (e))
+			error("[Error] %s", e, id=id)
 			continue
+		finally:
+			utils.release_object(d)
+			del d
+		# work deferred to the finish functions is not done yet
+		(deferred if handler.finish else finished).append(id)
+		if done and len(finished) >= CHECKPOINT_BATCH:
+			done.mark(asset, finished)
+			finished = []
+	for handler in handlers.values():
+		if handler.finish:
+			handler.finish(sink, options)
+	if done:
+		done.mark(asset, finished + deferred)
 
-		if otype not in handle_formats:
-			continue
 
-		d = obj.read()
-		save_path = os.path.join(dir, obj.type, d.name)
-		utils.make_dirs(save_path)
+def extract_task(task, output, archive, handle_formats, options):
+	"""Run the handlers on the objects of a scheduler Task, in a worker
 
-		if otype == "Mesh":
-			try:
-				mesh_data = None
-
-				if not objMesh:
-					mesh_data = BabylonMesh(d).export()
-					utils.write_to_file(save_path + ".babylon", mesh_data, mode="w")
-
-				mesh_data = OBJMesh(d).export()
-				utils.write_to_file(save_path + ".obj", mesh_data, mode="w")
-			except (NotImplementedError, RuntimeError) as e:
-				error("WARNING: Could not extract %r (%s)" % (d, e))
-				mesh_data = pickle.dumps(d._obj)
-				utils.write_to_file(save_path + ".Mesh.pickle", mesh_data, mode="wb")
-
-		elif otype == "TextAsset":
-			if isinstance(d.script, bytes):
-				utils.write_to_file(save_path + ".bin", d.script, mode="wb")
-			else:
-				utils.write_to_file(save_path + ".txt", d.script)
+	Returns the Recorder of the objects done, for the parent's checkpoint.
+	"""
+	if task.parts > 1:
+		info("Extracting %s [%i/%i]...", task.name, task.part + 1, task.parts, bundle=task.name)
+	else:
+		info("Extracting %s...", task.name, bundle=task.name)
+	recorder = checkpoint.Recorder()
+	with open(task.path, "rb") as f, cli.bundle(task.name):
+		with metrics.timer("load"):
+			bundle = unitypack.load(f)
 
-		elif otype == "Texture2D":
-			filename = d.name + ".png"
-			try:
-				image = d.image
-				if image is None:
-					info("WARNING: %s is an empty image" % (filename))
-					utils.write_to_file(save_path + ".empty", "")
-				else:
-					info("Decoding %r" % (d))
-					img = image
-					if flip:
-						img = ImageOps.flip(image)
-					img.save(save_path + ".png")
-			except Exception as e:
-				error("Failed to extract texture %s (%s)" % (d.name, e))
+		with open_sink(output, task.name, archive) as sink:
+			for asset, ids in scheduler.task_assets(bundle, task):
+				handle_asset(asset, handle_formats, sink, options, recorder, ids)
+	return recorder
 
 
+def extract_parallel(files, args, handle_formats, options, done):
+	"""Extract files with the scheduler, in args.jobs worker processes"""
+	# archives need a single writer, and are rewritten as a whole
+	tasks = scheduler.plan(
+		files, args.jobs, handle_formats,
+		split_bundles=not args.archive, done=None if args.archive else done,
+		whole_types=grouped_types(handle_formats)
+	)
+	if args.progress:
+		progress.start(scheduler.totals(tasks) or progress.count_objects(
+			files, handle_formats, None if args.archive else done
+		))
 
-def main():
-	p = ArgumentParser()
-	p.add_argument("files", nargs="+")
-	p.add_argument("--output", "-o", required=True)
+	def bundle_done(name):
+		if name not in bundles_left.incomplete:
+			done.mark_bundle(name)
+		progress.bundle_done()
+
+	bundles_left = scheduler.BundleTracker(tasks, bundle_done)
+
+	def task_done(task, recorder):
+		if not args.archive:
+			recorder.apply(done, task.name)
+		bundles_left.task_done(task)
+
+	func = partial(
+		extract_task, output=args.output, archive=args.archive,
+		handle_formats=handle_formats, options=options
+	)
+	scheduler.run(
+		tasks, func, args.jobs, on_result=task_done, on_error=bundles_left.task_failed
+	)
+	bundles_left.report()
+
+
+def add_arguments(p):
+	"""The options selecting and configuring the handlers"""
 	p.add_argument("--all", action="store_true")
 	p.add_argument("--images", action="store_true")
 	p.add_argument("--models", action="store_true")
 	p.add_argument("--text", action="store_true")
-	p.add_argument("-q", action="store_true")
-	p.add_argument("-qq", action="store_true")
+	p.add_argument("--fonts", action="store_true")
+	p.add_argument("--movies", action="store_true")
+	p.add_argument("--sprites", action="store_true")
+	p.add_argument("--audio", action="store_true")
+	# any other registered types, by unity type name
+	p.add_argument("--types", nargs="+", default=[], choices=sorted(HANDLERS),
+		metavar="TYPE")
 	# flip images the "right" way up
 	p.add_argument("--flip", action="store_true")
 	# option for obj meshes (instead of js)
 	p.add_argument("--obj", action="store_true")
-	args = p.parse_args(sys.argv[1:])
+	# weld duplicate vertices and reorder indices for the vertex cache
+	p.add_argument("--optimize-meshes", action="store_true")
+	# also write three.js json meshes, with positions and uvs stored as 16 bit
+	# integers (the babylon and obj meshes keep the floats)
+	p.add_argument("--quantize-meshes", action="store_true")
+	# write one archive per bundle, instead of a file per object
+	p.add_argument("--archive", choices=ARCHIVE_FORMATS)
+	p.add_argument("--threads", type=int,
+		help="threads used for writing sprites and audio in parallel")
+	# transcode audio, either with python-fsb5 or a local command
+	p.add_argument("--audio-encoder",
+		help="'fsb5' or a command, e.g. \"vgmstream-cli -o {output} {input}\"")
+	p.add_argument("--audio-format", default="ogg",
+		help="output extension for the --audio-encoder command")
+
+
+def option_values(args, exclude=()):
+	"""The values in args of the options of add_arguments()"""
+	parser = ArgumentParser(add_help=False)
+	add_arguments(parser)
+	return {k: getattr(args, k) for k in vars(parser.parse_args([])) if k not in exclude}
+
+
+def find_bundles(files):
+	"""The files, or the bundles in the directory if it is the only one"""
+	if len(files) == 1:
+		if os.path.isdir(files[0]):
+			return glob.glob(files[0] + "/*.unity3d")
+	return files
 
-	utils.Echo.quiet = args.q
-	utils.Echo.very_quiet = args.qq
 
+def get_formats(args):
+	"""The unity type names selected by the arguments"""
 	format_args = {
 		"images": "Texture2D",
 		"models": "Mesh",
 		"text": "TextAsset",
+		"fonts": "Font",
+		"movies": "MovieTexture",
+		"sprites": "Sprite",
+		"audio": "AudioClip",
 	}
-	handle_formats = []
+	handle_formats = list(args.types)
 	for a, classname in format_args.items():
 		if args.all or getattr(args, a):
 			handle_formats.append(classname)
+	if args.all:
+		handle_formats.extend(HANDLERS)
+	return set(handle_formats)
 
-	files = args.files
-	if len(args.files) == 1:
-		if os.path.isdir(args.files[0]):
-			files = glob.glob(args.files[0] + "/*.unity3d")
 
-	for file in files:
-		bundle_name = utils.filename_no_ext(file)
-		if bundle_name in EXCLUDES:
-			info("Skipping %s..." % (bundle_name))
-			continue
-		info("Extracting %s..." % (bundle_name))
-		save_path = os.path.join(args.output, bundle_name)
+def get_options(args):
+	return Options(
+		flip=args.flip, obj_mesh=args.obj, threads=args.threads,
+		audio_encoder=args.audio_encoder, audio_format=args.audio_format,
+		optimize_meshes=args.optimize_meshes, quantize_meshes=args.quantize_meshes
+	)
 
-		with open(file, "rb") as f:
-			bundle = unitypack.load(f)
 
-		for asset in bundle.assets:
-			handle_asset(asset, handle_formats, save_path,
-						 args.flip, args.obj, args.quiet)
+def main():
+	p = ArgumentParser()
+	p.add_argument("files", nargs="+")
+	p.add_argument("--output", "-o", required=True)
+	add_arguments(p)
+	scheduler.add_argument(p)
+	checkpoint.add_arguments(p)
+	cli.add_arguments(p, progress=True)
+	args = cli.parse_args(p)
+
+	handle_formats = get_formats(args)
+	try:
+		get_handlers(handle_formats)
+	except KeyError as e:
+		p.error(e.args[0])
+	options = get_options(args)
+
+	files = find_bundles(args.files)
+
+	# threads don't change what is written
+	run_options = option_values(args, exclude=["threads"])
+	with checkpoint.open_checkpoint(args, args.output, "extract", run_options) as done:
+		bundles = []
+		for file in files:
+			bundle_name = utils.filename_no_ext(file)
+			if bundle_name in EXCLUDES:
+				info("Skipping %s...", bundle_name, bundle=bundle_name)
+			elif done.bundle_done(bundle_name):
+				info("Skipping %s (done)...", bundle_name, bundle=bundle_name)
+			else:
+				bundles.append(file)
+
+		if args.jobs > 1:
+			extract_parallel(bundles, args, handle_formats, options, done)
+		else:
+			if args.progress:
+				# an archive is rewritten as a whole, its objects are all counted
+				progress.start(progress.count_objects(
+					bundles, handle_formats, None if args.archive else done
+				))
+			for file in bundles:
+				bundle_name = utils.filename_no_ext(file)
+				info("Extracting %s...", bundle_name, bundle=bundle_name)
+				# an archive is rewritten as a whole, only skip finished bundles
+				scope = done.scope(bundle_name) if not args.archive else None
+				with open(file, "rb") as f, cli.bundle(bundle_name):
+					with metrics.timer("load"):
+						bundle = unitypack.load(f)
+
+					with open_sink(args.output, bundle_name, args.archive) as sink:
+						for asset in bundle.assets:
+							handle_asset(asset, handle_formats, sink, options, scope)
+				done.mark_bundle(bundle_name)
+				progress.bundle_done()
+
+	progress.finish()
 
 
 if __name__ == "__main__":
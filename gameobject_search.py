@@ -1,5 +1,4 @@
 import os
-import sys
 import glob
 import pickle
 from collections import namedtuple
@@ -7,7 +6,9 @@ from collections import namedtuple
 import unitypack
 import argparse
 
-from utils import filename_no_ext, Echo
+import cli
+import metrics
+from utils import filename_no_ext, iter_objects, Echo
 
 
 (debug, info, error) = Echo.echo()
@@ -20,49 +21,43 @@ def get_bundle_cache(dir, name):
 	file_path = os.path.join(dir, "".join([name, ".pickle"]))
 	if os.path.isfile(file_path):
 		with open(file_path, "rb") as f:
-			info(f"Cache file found for '{name}'")
+			info("Cache file found for '%s'", name, bundle=name)
 			return pickle.load(f)
 
 
 def save_bundle_cache(dir, name, data):
 	file_path = os.path.join(dir, "".join([name, ".pickle"]))
 	with open(file_path, "wb") as f:
-		info(f"Cache file created for '{name}'")
+		info("Cache file created for '%s'", name, bundle=name)
 		pickle.dump(data, f)
 
 
 def build_dict(bundle_name, asset):
-	info(f"Building dict for '{bundle_name}'")
+	info("Building dict for '%s'", bundle_name, bundle=bundle_name)
 	gameobjects = {}
-	for id, obj in asset.objects.items():
-		try:
-			d = obj.read()
-		except Exception as e:
-			error(f"{id} '{e}'")
-			continue
-
+	for id, type, d in iter_objects(asset, ["GameObject"]):
 		name = ""
 		try:
 			name = d.name
 		except Exception:
 			pass
 
-		type = ""
-		try:
-			type = obj.type
-		except Exception:
-			pass
-
-		if type == "GameObject" and name:
+		if name:
 			go = GameObject(id, name, bundle_name.split("/")[0])
-			if name in gameobjects:
-				gameobjects[name.lower()].append(go)
-			else:
-				gameobjects[name.lower()] = [go]
+			gameobjects.setdefault(name.lower(), []).append(go)
 
 	return gameobjects
 
 
+def bundle_dict(file_name, bundle):
+	"""The game object dict of all the assets in the bundle"""
+	go_dict = {}
+	for asset in bundle.assets:
+		asset_bundle_name = f"{file_name}/{asset.name}"
+		go_dict.update(build_dict(asset_bundle_name, asset))
+	return go_dict
+
+
 def main():
 	# setup the command arguments
 	arg_parser = argparse.ArgumentParser()
@@ -74,14 +69,11 @@ def main():
 		help="the search string, case insensitive")
 	arg_parser.add_argument("--cache-only", action="store_true",
 		help="only use cached files, do not try to build anything")
-	arg_parser.add_argument("-q", action="store_true")
-	arg_parser.add_argument("-qq", action="store_true")
 	arg_parser.add_argument("--hide-errors", action="store_true",
 		help="display any errors encountered reading an asset")
-	args = arg_parser.parse_args(sys.argv[1:])
+	cli.add_arguments(arg_parser)
+	args = cli.parse_args(arg_parser)
 
-	Echo.quiet = args.q
-	Echo.very_quiet = args.qq
 	Echo.hide_errors = args.hide_errors
 
 	if os.path.isdir(args.input):
@@ -101,13 +93,10 @@ def main():
 			if args.cache_only:
 				# if only interested in cached files, try the next file
 				continue
-			go_dict = {}
-			with open(file, "rb") as f:
-				bundle = unitypack.load(f)
-			for asset in bundle.assets:
-				asset_bundle_name = f"{file_name}/{asset.name}"
-				# build the game object dict
-				go_dict.update(build_dict(asset_bundle_name, asset))
+			with open(file, "rb") as f, cli.bundle(file_name):
+				with metrics.timer("load"):
+					bundle = unitypack.load(f)
+				go_dict = bundle_dict(file_name, bundle)
 			# skip this file if dict is empty
 			if len(go_dict) <= 0:
 				continue
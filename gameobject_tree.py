@@ -1,15 +1,15 @@
 import argparse
-import json
 import os
-import sys
 from io import BytesIO
 
 import unitypack
 from PIL import ImageOps
 from unitypack.environment import UnityEnvironment
 
+import cli
+import metrics
 from shaders import extract_shader, redefine_shader
-from utils import vec_from_dict, write_to_file, Echo
+from utils import dump_json, vec_from_dict, write_to_file, Echo
 
 
 (debug, info, error) = Echo.echo()
@@ -159,24 +159,15 @@ class GameObject(Node):
         }
 
 
-class GameObjectEncoder(json.JSONEncoder):
-	def default(self, obj):
-		if hasattr(obj, "to_json"):
-			return obj.to_json()
-		else:
-			info(f"{obj} does not implement to_json()")
-			return json.JSONEncoder.default(self, obj)
-
-
 def get_by_id(sid, asset):
-	info(f"Loading {asset.name}")
+	info("Loading %s", asset.name)
 	for id, obj in asset.objects.items():
 		if sid != id:
 			continue
 		try:
 			d = obj.read()
 		except Exception as e:
-			error(f"ERROR {e}")
+			error("ERROR %s", e)
 			continue
 		return d
 
@@ -216,9 +207,10 @@ def traverse_transforms(transform, tree, parent=None):
 def extract_texture(texture, out_dir, flip=True):
 	filename = texture.name + ".png"
 	try:
-		image = texture.image
+		with metrics.timer("decode"):
+			image = texture.image
 	except NotImplementedError:
-		error(f"WARNING: Texture format not implemented. Skipping {filename}.")
+		error("WARNING: Texture format not implemented. Skipping %s.", filename, path=filename)
 		return
 
 	if image is None:
@@ -227,11 +219,12 @@ def extract_texture(texture, out_dir, flip=True):
 
 	info("Decoding {texture.name}")
 	# Texture2D objects are flipped
-	if flip:
-		img = ImageOps.flip(image)
-	# PIL has no method to write to a string :/
-	output = BytesIO()
-	img.save(output, format="png")
+	with metrics.timer("encode"):
+		if flip:
+			img = ImageOps.flip(image)
+		# PIL has no method to write to a string :/
+		output = BytesIO()
+		img.save(output, format="png")
 	write_to_file(
 		os.path.join(out_dir, filename),
 		output.getvalue(),
@@ -257,17 +250,37 @@ def extract_assets(game_object, out_dir):
 		extract_assets(child, out_dir)
 
 
+def export_prefab(game_object, output, compact=False):
+	"""Export the tree game_object is part of, returns its directory"""
+	root_object = get_root_object(game_object)
+	root_transform = get_transform(root_object)
+
+	tree = Tree()
+	traverse_transforms(root_transform, tree)
+
+	# create output directory
+	out_dir = os.path.join(output, tree.root.name)
+	if not os.path.exists(out_dir):
+		os.mkdir(out_dir)
+	# export the tree as json
+	with metrics.timer("encode"):
+		json_str = dump_json(tree.root, compact=compact)
+	with metrics.timer("write"):
+		write_to_file(os.path.join(out_dir, "data.json"), json_str)
+	# extract referenced textures, models and shaders
+	extract_assets(tree.root, out_dir)
+	return out_dir
+
+
 def main():
 	arg_parser = argparse.ArgumentParser()
 	arg_parser.add_argument("files", nargs="+", help="the unity3d files")
 	arg_parser.add_argument("id", help="the id of the base asset")
 	arg_parser.add_argument("output", help="the output directory")
-	arg_parser.add_argument("-q", action="store_true")
-	arg_parser.add_argument("-qq", action="store_true")
-	args = arg_parser.parse_args(sys.argv[1:])
-
-	Echo.quiet = args.q
-	Echo.very_quiet = args.qq
+	arg_parser.add_argument("--compact", action="store_true",
+		help="write data.json without indentation")
+	cli.add_arguments(arg_parser)
+	args = cli.parse_args(arg_parser)
 
 	base_id = int(args.id)
 
@@ -275,33 +288,20 @@ def main():
 	env = UnityEnvironment()
 
 	for file in args.files:
-		info(f"Reading {file}")
+		info("Reading %s", file)
 		f = open(file, "rb")
-		env.load(f)
+		with metrics.timer("load"):
+			env.load(f)
 
 	for bundle in env.bundles.values():
 		for asset in bundle.assets:
-			info(f"Parsing {asset.name}")
+			info("Parsing %s", asset.name)
 			game_object = get_by_id(base_id, asset)
 			if not game_object:
-				info(f"{base_id} not found in {asset.name}")
+				info("%s not found in %s", base_id, asset.name)
 				break
 
-			root_object = get_root_object(game_object)
-			root_transform = get_transform(root_object)
-
-			tree = Tree()
-			traverse_transforms(root_transform, tree)
-
-			# create output directory
-			out_dir = os.path.join(args.output, tree.root.name)
-			if not os.path.exists(out_dir):
-				os.mkdir(out_dir)
-			# export the tree as json
-			json_str = json.dumps(tree.root, cls=GameObjectEncoder, indent=4)
-			write_to_file(os.path.join(out_dir, "data.json"), json_str)
-			# extract referenced textures, models and shaders
-			extract_assets(tree.root, out_dir)
+			export_prefab(game_object, args.output, compact=args.compact)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+"""Extraction handlers for each Unity object type
+
+Handlers are registered by Unity type name, with the register decorator, and
+receive the object, the output sink and the extraction options. A handler
+registered with read=False gets the unread ObjectInfo instead, so it can
+decide itself if and how to read the object. Handlers may also register a
+finish function, called once all objects of an asset have been handled, and
+be grouped, when the finish function needs all of them at once (the objects
+of the asset are then never split between tasks).
+"""
+
+import os
+import pickle
+import shlex
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import ImageOps
+
+import metrics
+import utils
+from meshes import BabylonMesh, JSONMesh, OBJMesh, mesh_arrays, optimize, quantize
+
+
+(debug, info, error) = utils.Echo.echo()
+
+
+class Handler:
+	def __init__(self, type, func, read=True, finish=None, group=False):
+		self.type = type
+		self.func = func
+		self.read = read
+		self.finish = finish
+		self.group = group
+
+	def __repr__(self):
+		return "Handler(type={}, func={}, read={})".format(
+			self.type, self.func.__name__, self.read
+		)
+
+
+class Options:
+	"""Settings shared by all handlers"""
+
+	def __init__(self, flip=False, obj_mesh=False, threads=None,
+			audio_encoder=None, audio_format="ogg",
+			optimize_meshes=False, quantize_meshes=False):
+		# flip images the "right" way up
+		self.flip = flip
+		# only export obj meshes
+		self.obj_mesh = obj_mesh
+		# weld vertices and reorder indices
+		self.optimize_meshes = optimize_meshes
+		# also write three.js json meshes, with 16 bit positions and uvs
+		self.quantize_meshes = quantize_meshes
+		# number of threads for handlers writing in parallel
+		self.threads = threads
+		# "fsb5" or a command with {input} and {output} placeholders,
+		# raw audio data is written when not set
+		self.audio_encoder = audio_encoder
+		self.audio_format = audio_format
+		# work collected by handlers, until their finish function is called
+		self.pending = {}
+
+
+HANDLERS = {}
+
+
+def register(type, read=True, finish=None, group=False):
+	"""Decorator registering the function as the handler of type"""
+	def decorator(func):
+		HANDLERS[type] = Handler(type, func, read, finish, group)
+		return func
+	return decorator
+
+
+def get_handlers(types):
+	"""The registered handlers for the given type names"""
+	unknown = sorted(t for t in types if t not in HANDLERS)
+	if unknown:
+		raise KeyError("No handler for %s" % (", ".join(unknown)))
+	return {t: HANDLERS[t] for t in types}
+
+
+def grouped_types(types):
+	"""The type names, of those given, with grouped handlers"""
+	return [t for t, handler in get_handlers(types).items() if handler.group]
+
+
+@register("Mesh")
+def handle_mesh(d, sink, options):
+	save_path = os.path.join("Mesh", d.name)
+	try:
+		# decode (or decompress) the mesh once, for both exporters
+		with metrics.timer("decode"):
+			arrays = mesh_arrays(d)
+		if options.optimize_meshes:
+			with metrics.timer("encode"):
+				arrays = optimize(arrays)
+		mesh_data = None
+
+		if not options.obj_mesh:
+			with metrics.timer("encode"):
+				mesh_data = BabylonMesh(d, arrays).export()
+			sink.write(save_path + ".babylon", mesh_data, mode="w")
+
+		with metrics.timer("encode"):
+			mesh_data = OBJMesh(d, arrays).export()
+		sink.write(save_path + ".obj", mesh_data, mode="w")
+
+		if options.quantize_meshes:
+			# the other formats have no quantized attributes, they keep the floats
+			try:
+				with metrics.timer("encode"):
+					mesh_data = JSONMesh(d, quantize(arrays)).export()
+				sink.write(save_path + ".json", mesh_data, mode="w")
+			except RuntimeError as e:
+				info("WARNING: No three.js mesh for %r (%s)", d, e, object=d.name)
+	except (NotImplementedError, RuntimeError) as e:
+		error("WARNING: Could not extract %r (%s)", d, e, object=d.name)
+		mesh_data = pickle.dumps(d._obj)
+		sink.write(save_path + ".Mesh.pickle", mesh_data, mode="wb")
+
+
+@register("TextAsset")
+def handle_text(d, sink, options):
+	save_path = os.path.join("TextAsset", d.name)
+	if isinstance(d.script, bytes):
+		sink.write(save_path + ".bin", d.script, mode="wb")
+	else:
+		sink.write(save_path + ".txt", d.script)
+
+
+@register("Texture2D")
+def handle_texture(d, sink, options):
+	save_path = os.path.join("Texture2D", d.name)
+	filename = d.name + ".png"
+	try:
+		with metrics.timer("decode"):
+			image = d.image
+		if image is None:
+			info("WARNING: %s is an empty image", filename)
+			sink.write(save_path + ".empty", "")
+		else:
+			info("Decoding %r", d, object=d.name)
+			with metrics.timer("encode"):
+				img = image
+				if options.flip:
+					img = ImageOps.flip(image)
+				output = BytesIO()
+				img.save(output, format="png")
+			sink.write(save_path + ".png", output.getvalue(), mode="wb")
+	except Exception as e:
+		error("Failed to extract texture %s (%s)", d.name, e, object=d.name)
+
+
+@register("Font")
+def handle_font(d, sink, options):
+	data = d.data
+	if not data:
+		info("WARNING: %s has no font data", d.name)
+		return
+	if isinstance(data, list):
+		data = bytes(data)
+	ext = ".otf" if data[:4] == b"OTTO" else ".ttf"
+	sink.write(os.path.join("Font", d.name) + ext, data, mode="wb")
+
+
+@register("MovieTexture")
+def handle_movie(d, sink, options):
+	data = d.movie_data
+	if not data:
+		info("WARNING: %s has no movie data", d.name)
+		return
+	sink.write(os.path.join("MovieTexture", d.name) + ".ogv", data, mode="wb")
+
+
+def finish_sprites(sink, options):
+	"""Decode each atlas once and crop out all of its sprites"""
+	atlases = options.pending.pop("Sprite", {})
+	for pointer, sprites in atlases.values():
+		try:
+			with metrics.timer("decode"):
+				texture = pointer.resolve()
+				atlas = texture.image
+		except Exception as e:
+			error("Failed to decode sprite atlas (%s)", e)
+			continue
+		if atlas is None:
+			info("WARNING: %s is an empty image", texture.name)
+			continue
+		info("Slicing %i sprites from %r", len(sprites), texture, sprites=len(sprites))
+
+		def save_sprite(sprite):
+			name, rect = sprite
+			# texture rows are stored bottom up, as are the sprite rects
+			left, top = round(rect["x"]), round(rect["y"])
+			box = (left, top, left + round(rect["width"]), top + round(rect["height"]))
+			try:
+				with metrics.timer("encode"):
+					img = atlas.crop(box)
+					if options.flip:
+						img = ImageOps.flip(img)
+					output = BytesIO()
+					img.save(output, format="png")
+				sink.write(os.path.join("Sprite", name) + ".png", output.getvalue(), mode="wb")
+			except Exception as e:
+				error("Failed to extract sprite %s (%s)", name, e, object=name)
+
+		# encoding releases the GIL, so the sprites can be written in parallel
+		with ThreadPoolExecutor(options.threads) as executor:
+			for result in executor.map(save_sprite, sprites):
+				pass
+
+
+# the sprites of an atlas are cut out of a single decode of its texture
+@register("Sprite", finish=finish_sprites, group=True)
+def handle_sprite(d, sink, options):
+	rd = d.rd
+	pointer = rd["texture"]
+	if not pointer:
+		info("WARNING: %s has no texture", d.name)
+		return
+	rect = rd.get("textureRect") or d.rect
+	# group the sprites by atlas, they are cut out once the asset is done
+	atlases = options.pending.setdefault("Sprite", {})
+	key = (pointer.file_id, pointer.path_id)
+	if key not in atlases:
+		atlases[key] = (pointer, [])
+	atlases[key][1].append((d.name, rect))
+
+
+# size of the chunks audio data is streamed in
+AUDIO_CHUNK_SIZE = 1024 * 1024
+
+# file extensions for the unity 4 audio types (AudioFormat)
+AUDIO_EXTENSIONS = {
+	13: ".mp3",
+	14: ".ogg",
+	20: ".wav",
+	2: ".aif",
+	10: ".it",
+	12: ".mod",
+	17: ".s3m",
+	21: ".xm",
+}
+
+# the resource buffers are shared between clips, only one reader at a time
+audio_lock = threading.Lock()
+
+
+class AudioStream:
+	"""Read a clip's payload in chunks, from its resource or in-memory data"""
+
+	def __init__(self, resource=None, data=None):
+		self.resource = resource
+		self.data = data
+
+	def chunks(self):
+		if self.data is not None:
+			yield self.data
+			return
+		asset, position, size = self.resource
+		end = position + size
+		while position < end:
+			with audio_lock:
+				chunk = utils.read_asset_data(asset, position, min(AUDIO_CHUNK_SIZE, end - position))
+			if not chunk:
+				break
+			position += len(chunk)
+			yield chunk
+
+	def copy_to(self, f):
+		for chunk in self.chunks():
+			f.write(chunk)
+
+
+def encode_fsb5(path, name):
+	"""Rebuild the samples of a FSB5 file, as returned by python-fsb5"""
+	from fsb5 import FSB5
+
+	with open(path, "rb") as f:
+		fsb = FSB5(f.read())
+	ext = fsb.get_sample_extension()
+	for i, sample in enumerate(fsb.samples):
+		suffix = "-%i" % (i) if i > 0 else ""
+		yield name + suffix + "." + ext, fsb.rebuild_sample(sample)
+
+
+def encode_command(path, name, command, format):
+	"""Run a local encoder, command has {input} and {output} placeholders"""
+	with tempfile.TemporaryDirectory() as tmp:
+		output = os.path.join(tmp, "out." + format)
+		args = [a.format(input=path, output=output) for a in shlex.split(command)]
+		subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+		with open(output, "rb") as f:
+			yield name + "." + format, f.read()
+
+
+def save_audio(clip, sink, options):
+	name, ext, stream = clip
+	save_path = os.path.join("AudioClip", name)
+	# fsb5 only decodes fsb banks, the other formats are written as they are
+	encoder = options.audio_encoder
+	if encoder == "fsb5" and ext != ".fsb":
+		encoder = None
+	try:
+		if not encoder:
+			with sink.open(save_path + ext, "wb") as f:
+				stream.copy_to(f)
+			return
+		# encoders work on files, spool the raw data to disk first
+		with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as f:
+			stream.copy_to(f)
+		try:
+			if encoder == "fsb5":
+				samples = encode_fsb5(f.name, save_path)
+			else:
+				samples = encode_command(f.name, save_path, encoder, options.audio_format)
+			with metrics.timer("encode"):
+				samples = list(samples)
+			for filename, data in samples:
+				sink.write(filename, data, mode="wb")
+		finally:
+			os.remove(f.name)
+	except Exception as e:
+		error("Failed to extract audio %s (%s)", name, e, object=name)
+
+
+def finish_audio(sink, options):
+	"""Write all the clips of the asset in parallel"""
+	clips = options.pending.pop("AudioClip", [])
+	if not clips:
+		return
+	info("Writing %i audio clips", len(clips), clips=len(clips))
+	with ThreadPoolExecutor(options.threads) as executor:
+		for result in executor.map(lambda c: save_audio(c, sink, options), clips):
+			pass
+
+
+@register("AudioClip", finish=finish_audio)
+def handle_audio(d, sink, options):
+	if "m_AudioData" in d._obj:
+		# unity 4, the data is part of the object, written before it's released
+		ext = AUDIO_EXTENSIONS.get(d._obj.get("m_Type"), ".bin")
+		save_audio((d.name, ext, AudioStream(data=d._obj["m_AudioData"])), sink, options)
+		return
+	clips = options.pending.setdefault("AudioClip", [])
+	resource = d.resource
+	if not resource or not resource.asset or not resource.size:
+		info("WARNING: %s has no audio data", d.name)
+		return
+	# only keep the location of the data, it is streamed when written
+	location = (resource.asset, resource.offset, resource.size)
+	clips.append((d.name, ".fsb", AudioStream(resource=location)))
@@ -1,92 +1,416 @@
+import numpy as np
+from unitypack.export import MeshData
+
 import utils
 
 (debug, info, error) = utils.Echo.echo()
 
-class BabylonMesh:
-	"""JSON Mesh format defined by Babylon.js"""
 
-	def __init__(self, mesh):
-		from unitypack.export import MeshData
+def unpack_ints(vector):
+	"""Unpack the items of a Unity PackedBitVector as integers"""
+	count = vector["m_NumItems"]
+	bit_size = vector["m_BitSize"]
+	if not count or not bit_size:
+		return np.zeros(count, dtype=np.uint32)
+	data = np.frombuffer(bytes(vector["m_Data"]), dtype=np.uint8)
+	# items are packed least significant bit first, across byte boundaries
+	bits = np.unpackbits(data, bitorder="little")[:count * bit_size]
+	bits = bits.reshape(count, bit_size).astype(np.uint32)
+	weights = np.left_shift(np.uint32(1), np.arange(bit_size, dtype=np.uint32))
+	return bits @ weights
 
-		if mesh.mesh_compression:
-			# TODO handle compressed meshes
-			raise NotImplementedError("(%s) compressed meshes are not supported" % (mesh.name))
-		self.mesh_data = MeshData(mesh)
-		self.mesh = mesh
-		self.name = mesh.name
 
-	@staticmethod
-	def vec2_list(vec):
-		return [vec.x, 1 - vec.y]
+def unpack_floats(vector):
+	"""Unpack the items of a Unity PackedBitVector as floats"""
+	count = vector["m_NumItems"]
+	bit_size = vector["m_BitSize"]
+	if not count or not bit_size:
+		return np.full(count, vector["m_Start"], dtype=np.float64)
+	scale = vector["m_Range"] / ((1 << bit_size) - 1)
+	return unpack_ints(vector) * scale + vector["m_Start"]
 
-	@staticmethod
-	def vec3_list(vec):
-		return [-vec.x, vec.y, vec.z]
 
-	@staticmethod
-	def vec4_list(vec):
-		return [vec.x, vec.y, vec.z, vec.w]
+def index_dtype(vertex_count):
+	"""The smallest integer type able to index vertex_count vertices"""
+	return np.uint16 if vertex_count <= 0x10000 else np.uint32
 
-	@staticmethod
-	def add_uv(uvs, uv):
-		out = []
-		for u in uv:
-			out.extend(JSONMesh.vec2_list(u))
-		if out:
-			uvs.append(out)
 
-	@staticmethod
-	def uv_list(uv):
-		out = []
-		for u in uv:
-			out.extend(JSONMesh.vec2_list(u))
-		return out
+def triangle_list(indices):
+	"""(n, 3) triangles of a submesh's indices, dropping a partial last one"""
+	return indices[:len(indices) - len(indices) % 3].reshape(-1, 3)
 
-	@staticmethod
-	def face_list(indices, type, id):
-		ret = [type]
-		triple = []
-		for i in indices[::-1]:
-			triple.append(i)
-		ret.extend(triple)
-		ret.append(id)
-		ret.extend(triple)
-		ret.extend(triple)
-		return ret
+
+class MeshArrays:
+	"""Vertex attributes and per submesh indices of a mesh, as arrays
+
+	All submeshes index into the same vertex buffer.
+	"""
+
+	def __init__(self, name, vertices, normals=None, colors=None, uvs=None, submeshes=None):
+		self.name = name
+		# (n, 3) float positions
+		self.vertices = vertices
+		# (n, 3) float normals, may be empty
+		self.normals = normals if normals is not None else np.zeros((0, 3))
+		# (n, 4) colors with 0-255 components, may be empty
+		self.colors = colors if colors is not None else np.zeros((0, 4), dtype=np.uint8)
+		# list of (n, 2) float uv channels
+		self.uvs = uvs or []
+		# list of flat index arrays, one per submesh
+		dtype = index_dtype(len(vertices))
+		self.submeshes = [np.asarray(s, dtype=dtype) for s in submeshes or []]
+		# (scale, offset) of the attributes stored as 16 bit integers,
+		# keyed by "vertices" or "uv<channel>"
+		self.quantization = {}
+
+	@property
+	def indices(self):
+		"""The indices of all submeshes, as one array"""
+		if not self.submeshes:
+			return np.zeros(0, dtype=index_dtype(len(self.vertices)))
+		return np.concatenate(self.submeshes)
+
+	def submesh_ranges(self):
+		"""Yield (index start, index count, first vertex, vertex count) per submesh"""
+		start = 0
+		for sub in self.submeshes:
+			if len(sub):
+				first = int(sub.min())
+				count = int(sub.max()) - first + 1
+			else:
+				first = count = 0
+			yield start, len(sub), first, count
+			start += len(sub)
+
+	def uv(self, channel):
+		if channel < len(self.uvs):
+			return self.uvs[channel]
+		return np.zeros((0, 2))
+
+	def dequantized(self, name, values):
+		"""The float values of an attribute, whether it is quantized or not"""
+		if name in self.quantization:
+			scale, offset = self.quantization[name]
+			return values * scale + offset
+		return values
+
+
+def decode_compressed(mesh):
+	"""Decode the m_CompressedMesh data of a mesh"""
+	compressed = mesh.compressed_mesh
+
+	vertices = unpack_floats(compressed["m_Vertices"]).reshape(-1, 3)
+	vertex_count = len(vertices)
+
+	# uv channels are stored one after the other
+	uvs = []
+	packed_uvs = unpack_floats(compressed["m_UV"]).reshape(-1, 2)
+	if vertex_count:
+		for i in range(len(packed_uvs) // vertex_count):
+			uvs.append(packed_uvs[i * vertex_count:(i + 1) * vertex_count])
+
+	# normals only store x and y, z is rebuilt with its sign bit
+	normals = unpack_floats(compressed["m_Normals"]).reshape(-1, 2)
+	if len(normals):
+		signs = unpack_ints(compressed["m_NormalSigns"])[:len(normals)]
+		z = np.sqrt(np.clip(1 - (normals ** 2).sum(axis=1), 0, 1))
+		z[signs == 0] *= -1
+		normals = np.column_stack((normals, z))
+	else:
+		normals = np.zeros((0, 3))
+
+	colors = None
+	if "m_FloatColors" in compressed and compressed["m_FloatColors"]["m_NumItems"]:
+		colors = unpack_floats(compressed["m_FloatColors"]).reshape(-1, 4)
+		colors = np.rint(np.clip(colors, 0, 1) * 255).astype(np.uint8)
+	elif "m_Colors" in compressed and compressed["m_Colors"]["m_NumItems"]:
+		# unity 4, packed 32 bit rgba
+		packed = unpack_ints(compressed["m_Colors"]).astype("<u4")
+		colors = packed.view(np.uint8).reshape(-1, 4)
+
+	triangles = unpack_ints(compressed["m_Triangles"])
+	submeshes = []
+	for sub in mesh.submeshes:
+		if sub.topology:
+			raise NotImplementedError("(%s) topologies are not supported" % (mesh.name))
+		# compressed meshes always index with 16 bit values
+		start = sub.first_byte // 2
+		submeshes.append(triangle_list(triangles[start:start + sub.index_count]).ravel())
+
+	return MeshArrays(mesh.name, vertices, normals, colors, uvs, submeshes)
+
+
+class VertexData(MeshData):
+	"""UnityPack's MeshData, without reading the indices one at a time"""
+
+	def extract_indices(self):
+		pass
+
+
+def read_indices(mesh):
+	"""Read the index range of each submesh, from the index buffer"""
+	# unity 2017.3+ may use 32 bit indices
+	dtype = "<u4" if mesh._obj.get("m_IndexFormat", 0) == 1 else "<u2"
+	buffer = bytes(mesh.index_buffer)
+	submeshes = []
+	for sub in mesh.submeshes:
+		if sub.topology:
+			raise NotImplementedError("(%s) topologies are not supported" % (mesh.name))
+		# a partial triangle at the end is dropped
+		submeshes.append(np.frombuffer(
+			buffer, dtype=dtype, count=sub.index_count - sub.index_count % 3,
+			offset=sub.first_byte
+		))
+	return submeshes
+
+
+def mesh_arrays(mesh):
+	"""The MeshArrays of a mesh, whether it is compressed or not"""
+	if mesh.mesh_compression:
+		return decode_compressed(mesh)
+
+	data = VertexData(mesh)
+	uvs = [
+		np.array([(u.x, u.y) for u in uv], dtype=np.float64).reshape(-1, 2)
+		for uv in (data.uv1, data.uv2, data.uv3, data.uv4)
+	]
+	return MeshArrays(
+		mesh.name,
+		np.array([(v.x, v.y, v.z) for v in data.vertices], dtype=np.float64).reshape(-1, 3),
+		np.array([(n.x, n.y, n.z) for n in data.normals], dtype=np.float64).reshape(-1, 3),
+		np.array([(c.x, c.y, c.z, c.w) for c in data.colors], dtype=np.uint8).reshape(-1, 4),
+		uvs,
+		read_indices(mesh)
+	)
+
+
+def weld_vertices(data):
+	"""Merge vertices with identical attributes, keeping first use order"""
+	count = len(data.vertices)
+	columns = [data.vertices]
+	for attr in [data.normals, data.colors] + data.uvs:
+		if len(attr) == count:
+			columns.append(attr)
+	if not count:
+		return data
+	rows = np.column_stack(columns)
+	unique, first, inverse = np.unique(
+		rows, axis=0, return_index=True, return_inverse=True
+	)
+	# keep the welded vertices in their original relative order
+	order = np.argsort(first)
+	keep = first[order]
+	remap = np.empty(len(order), dtype=np.int64)
+	remap[order] = np.arange(len(order))
+	remap = remap[inverse.ravel()]
+	return remap_vertices(data, keep, remap)
+
+
+def remap_vertices(data, keep, remap):
+	"""Take the vertices in keep, remap maps the old indices to the new ones"""
+	count = len(data.vertices)
+
+	def take(attr):
+		return attr[keep] if len(attr) == count else attr
+
+	ret = MeshArrays(
+		data.name,
+		data.vertices[keep],
+		take(data.normals),
+		take(data.colors),
+		[take(uv) for uv in data.uvs],
+		[remap[sub] for sub in data.submeshes]
+	)
+	ret.quantization = dict(data.quantization)
+	return ret
+
+
+def tipsify(triangles, vertex_count, cache_size=16):
+	"""Reorder triangles for vertex cache locality
+
+	Implements Sander et al. "Fast Triangle Reordering for Vertex Locality
+	and Reduced Overdraw", returns the reordered (n, 3) triangles.
+	"""
+	tri_count = len(triangles)
+	if not tri_count:
+		return triangles
+	# triangles adjacent to each vertex
+	flat = triangles.ravel().astype(np.int64)
+	order = np.argsort(flat, kind="stable")
+	adjacency = (order // 3).tolist()
+	offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+	np.cumsum(np.bincount(flat, minlength=vertex_count), out=offsets[1:])
+	offsets = offsets.tolist()
+	live = np.bincount(flat, minlength=vertex_count).tolist()
+	tris = triangles.tolist()
+
+	timestamps = [0] * vertex_count
+	emitted = [False] * tri_count
+	dead_end = []
+	output = []
+	time = cache_size + 1
+	cursor = 0
+	fan = int(flat[0])
+
+	while fan >= 0:
+		candidates = []
+		for t in adjacency[offsets[fan]:offsets[fan + 1]]:
+			if emitted[t]:
+				continue
+			emitted[t] = True
+			output.append(t)
+			for v in tris[t]:
+				dead_end.append(v)
+				candidates.append(v)
+				live[v] -= 1
+				if time - timestamps[v] > cache_size:
+					timestamps[v] = time
+					time += 1
+
+		# next fanning vertex, preferring ones still in the cache
+		fan = -1
+		best = -1
+		for v in candidates:
+			if live[v] > 0:
+				priority = 0
+				if time - timestamps[v] + 2 * live[v] <= cache_size:
+					priority = time - timestamps[v]
+				if priority > best:
+					best = priority
+					fan = v
+		if fan < 0:
+			while dead_end:
+				v = dead_end.pop()
+				if live[v] > 0:
+					fan = v
+					break
+		if fan < 0:
+			while cursor < vertex_count:
+				if live[cursor] > 0:
+					fan = cursor
+					break
+				cursor += 1
+
+	assert len(output) == tri_count, "tipsify dropped triangles"
+	return triangles[np.array(output, dtype=np.int64)]
+
+
+def reorder_indices(data, cache_size=16):
+	"""Reorder each submesh's triangles for the vertex cache, then the
+	vertices by first use, for vertex fetch locality"""
+	count = len(data.vertices)
+	submeshes = [
+		tipsify(triangle_list(sub), count, cache_size).ravel()
+		for sub in data.submeshes
+	]
+	indices = np.concatenate(submeshes) if submeshes else np.zeros(0, dtype=np.int64)
+	# vertices in the order they are first referenced, unused ones last
+	first_use = np.full(count, len(indices), dtype=np.int64)
+	np.minimum.at(first_use, indices.astype(np.int64), np.arange(len(indices)))
+	keep = np.argsort(first_use, kind="stable")
+	remap = np.empty(count, dtype=np.int64)
+	remap[keep] = np.arange(count)
+	data = MeshArrays(data.name, data.vertices, data.normals, data.colors, data.uvs, submeshes)
+	return remap_vertices(data, keep, remap)
+
+
+def quantize_attribute(values):
+	"""Quantize to 16 bits per component, returns (values, scale, offset)"""
+	offset = values.min(axis=0)
+	scale = (values.max(axis=0) - offset) / 0xFFFF
+	# constant components would divide by zero
+	safe = np.where(scale > 0, scale, 1)
+	quantized = np.rint((values - offset) / safe).astype(np.uint16)
+	return quantized, scale, offset
+
+
+def quantize(data):
+	"""Store positions and uvs as 16 bit integers with a scale and offset"""
+	if not len(data.vertices) or "vertices" in data.quantization:
+		return data
+	vertices, scale, offset = quantize_attribute(data.vertices)
+	ret = MeshArrays(data.name, vertices, data.normals, data.colors, list(data.uvs), data.submeshes)
+	ret.quantization["vertices"] = (scale, offset)
+	for i, uv in enumerate(ret.uvs):
+		if len(uv):
+			ret.uvs[i], scale, offset = quantize_attribute(uv)
+			ret.quantization["uv%i" % (i)] = (scale, offset)
+	return ret
+
+
+def optimize(data, weld=True, reorder=True, quantized=False):
+	"""Optional post decode stage, making meshes smaller and cache friendly"""
+	if weld:
+		data = weld_vertices(data)
+	if reorder:
+		data = reorder_indices(data)
+	if quantized:
+		data = quantize(data)
+	return data
+
+
+def flip_x(vectors):
+	"""Unity is left handed, negate x for right handed formats"""
+	return vectors * np.array([-1, 1, 1])
+
+
+def flip_uv(uvs):
+	return np.column_stack((uvs[:, 0], 1 - uvs[:, 1]))
+
+
+def export_positions(data):
+	"""Positions for the json exporters, with their quantization (or None)"""
+	if "vertices" not in data.quantization:
+		return flip_x(data.vertices).ravel().tolist(), None
+	scale, offset = data.quantization["vertices"]
+	# the x flip is applied to the scale and offset
+	flip = np.array([-1, 1, 1])
+	params = {"scale": (scale * flip).tolist(), "offset": (offset * flip).tolist()}
+	return data.vertices.ravel().tolist(), params
+
+
+def export_uvs(data, channel):
+	"""Uvs for the json exporters, with their quantization (or None)"""
+	name = "uv%i" % (channel)
+	uv = data.uv(channel)
+	if name not in data.quantization:
+		return flip_uv(uv).ravel().tolist(), None
+	scale, offset = data.quantization[name]
+	# 1 - (q * s + o) == q * -s + (1 - o)
+	params = {
+		"scale": [float(scale[0]), float(-scale[1])],
+		"offset": [float(offset[0]), float(1 - offset[1])]
+	}
+	return uv.ravel().tolist(), params
+
+
+class BabylonMesh:
+	"""JSON Mesh format defined by Babylon.js"""
+
+	def __init__(self, mesh, data=None):
+		self.mesh_data = data if data is not None else mesh_arrays(mesh)
+		self.mesh = mesh
+		self.name = self.mesh_data.name
 
 	def export(self):
 		import json
 
-		# check all elements exists
-		# TODO empty arrays won't match here
-		# if not self.mesh_data.vertices or not self.mesh_data.normals or \
-		# 		not self.mesh_data.uv1 or not self.mesh_data.indices:
-		# 	raise RuntimeError("%s is missing some required elements" % self.mesh.name)
-		vertices = []
-		uvs = []
-		faces = []
-		normals = []
-		colors = []
-		indices = []
-		for v in self.mesh_data.vertices:
-			vertices.extend(self.vec3_list(v))
-		for n in self.mesh_data.normals:
-			normals.extend(self.vec3_list(n))
-		for c in self.mesh_data.colors:
-			colors.extend(self.vec4_list(c))
-		for x in self.mesh_data.indices:
-			indices.extend(x)
-
-		# verts_per_face = 3
-		# face_type = 42
-		# sub_count = len(self.mesh.submeshes)
-		# for i in range(0, sub_count):
-		# 	face_tri = []
-		# 	for t in self.mesh_data.triangles[i]:
-		# 		face_tri.append(t)
-		# 		if len(face_tri) == verts_per_face:
-		# 			faces.extend(self.face_list(face_tri, face_type, i))
-		# 			face_tri = []
+		data = self.mesh_data
+		# babylon.js has no quantized attributes, they are written as floats
+		vertices = flip_x(data.dequantized("vertices", data.vertices)).ravel().tolist()
+		uvs = flip_uv(data.dequantized("uv0", data.uv(0))).ravel().tolist()
+		normals = flip_x(data.normals).ravel().tolist()
+		colors = data.colors.ravel().tolist()
+		indices = data.indices.tolist()
+		submeshes = [{
+				"materialIndex": i,
+				"verticesStart": first,
+				"verticesCount": count,
+				"indexStart": start,
+				"indexCount": length
+			}
+			for i, (start, length, first, count) in enumerate(data.submesh_ranges())
+		]
 
 		mesh = {
 			"name": self.name,
@@ -103,20 +427,13 @@ class BabylonMesh:
 			"receiveShadows": False,
 			"positions": vertices,
 			"normals": normals,
-			"uvs": self.uv_list(self.mesh_data.uv1),
+			"uvs": uvs,
 			"indices": indices,
-			"subMeshes": [{
-					"materialIndex": 0,
-					"verticesStart": 0,
-					"verticesCount": int(len(vertices) / 3),
-					"indexStart": 0,
-					"indexCount": len(indices)
-				}
-			],
+			"subMeshes": submeshes,
 			"instances": []
 		};
-		if self.mesh_data.uv2:
-			mesh["uvs2"] = self.uv_list(self.mesh_data.uv2)
+		if len(data.uv(1)):
+			mesh["uvs2"] = flip_uv(data.dequantized("uv1", data.uv(1))).ravel().tolist()
 		if colors:
 			mesh["colors"] = colors
 
@@ -134,7 +451,10 @@ class BabylonMesh:
 			"skeletons": []
 		}
 
-		debug(f"v {len(mesh['positions'])/3} n {len(mesh['normals'])/3} i {len(mesh['indices'])/3} uv {len(mesh['uvs'])/2}")
+		debug(
+			"v %i n %i i %i uv %i", len(mesh["positions"]) // 3, len(mesh["normals"]) // 3,
+			len(mesh["indices"]) // 3, len(mesh["uvs"]) // 2, object=self.name
+		)
 
 		return json.dumps(babylon)
 
@@ -157,90 +477,117 @@ class JSONMesh:
 		}
 	}
 	"""
-	def __init__(self, mesh):
-		from unitypack.export import MeshData
-
-		if mesh.mesh_compression:
-			# TODO handle compressed meshes
-			raise NotImplementedError("(%s) compressed meshes are not supported" % (mesh.name))
-		self.mesh_data = MeshData(mesh)
+	def __init__(self, mesh, data=None):
+		self.mesh_data = data if data is not None else mesh_arrays(mesh)
 		self.mesh = mesh
 
 	@staticmethod
-	def vec2_list(vec):
-		# TODO check Three.js uv fix thingy
-		return [vec.x, 1 - vec.y]
-
-	@staticmethod
-	def vec3_list(vec):
-		return [-vec.x, vec.y, vec.z]
-
-	@staticmethod
-	def vec4_list(vec):
-		return [vec.x, vec.y, vec.z, vec.w]
-
-	@staticmethod
-	def add_uv(uvs, uv):
-		out = []
-		for u in uv:
-			out.extend(JSONMesh.vec2_list(u))
-		if out:
-			uvs.append(out)
-
-	@staticmethod
-	def face_list(indices, type, id):
-		ret = [type]
-		triple = []
-		for i in indices[::-1]:
-			triple.append(i)
-		ret.extend(triple)
-		ret.append(id)
-		ret.extend(triple)
-		ret.extend(triple)
-		return ret
+	def face_list(triangles, type, id):
+		"""Faces for (n, 3) triangles, with the material id and vertex uvs/normals"""
+		n = len(triangles)
+		triple = triangles[:, ::-1]
+		return np.column_stack((
+			np.full(n, type), triple, np.full(n, id), triple, triple
+		)).ravel()
 
 	def export(self):
 		import json
 
+		data = self.mesh_data
 		# check all elements exists
-		if not self.mesh_data.vertices or not self.mesh_data.normals or \
-				not self.mesh_data.uv1 or not self.mesh_data.indices:
-			raise RuntimeError("%s is missing some required elements" % self.mesh.name)
-		vertices = []
+		if not len(data.vertices) or not len(data.normals) or \
+				not len(data.uv(0)) or not len(data.indices):
+			raise RuntimeError("%s is missing some required elements" % data.name)
+
+		# TODO check Three.js uv fix thingy
 		uvs = []
-		faces = []
-		normals = []
-		colors = []
-		for v in self.mesh_data.vertices:
-			vertices.extend(self.vec3_list(v))
-		for n in self.mesh_data.normals:
-			normals.extend(self.vec3_list(n))
-		for c in self.mesh_data.colors:
-			colors.extend(self.vec4_list(c))
-
-		self.add_uv(uvs, self.mesh_data.uv1)
-		self.add_uv(uvs, self.mesh_data.uv2)
-		self.add_uv(uvs, self.mesh_data.uv3)
-		self.add_uv(uvs, self.mesh_data.uv4)
-
-		verts_per_face = 3
+		uvs_quantization = []
+		for i, uv in enumerate(data.uvs):
+			if len(uv):
+				values, params = export_uvs(data, i)
+				uvs.append(values)
+				uvs_quantization.append(params)
+		vertices, vertices_quantization = export_positions(data)
+
 		face_type = 42
-		sub_count = len(self.mesh.submeshes)
-		for i in range(0, sub_count):
-			face_tri = []
-			for t in self.mesh_data.triangles[i]:
-				face_tri.append(t)
-				if len(face_tri) == verts_per_face:
-					faces.extend(self.face_list(face_tri, face_type, i))
-					face_tri = []
+		faces = [
+			self.face_list(triangle_list(triangles), face_type, i)
+			for i, triangles in enumerate(data.submeshes)
+		]
+		faces = np.concatenate(faces).tolist() if faces else []
+		groups = [
+			{"start": start, "count": length, "materialIndex": i}
+			for i, (start, length, first, count) in enumerate(data.submesh_ranges())
+		]
 
 		mesh = {
 			"metadata": { "version": 4, "type": "Geometry" },
-			"indices": self.mesh_data.indices,
+			"indices": data.indices.tolist(),
+			"groups": groups,
 			"vertices": vertices,
 			"uvs": uvs,
 			"faces": faces,
-			"normals": normals,
-			"colors": colors
+			"normals": flip_x(data.normals).ravel().tolist(),
+			"colors": data.colors.ravel().tolist()
 		}
+		# 16 bit attributes, value = q * scale + offset
+		if vertices_quantization:
+			mesh["verticesQuantization"] = vertices_quantization
+		if any(uvs_quantization):
+			mesh["uvsQuantization"] = uvs_quantization
 		return json.dumps(mesh)
+
+
+class OBJMesh:
+	"""Wavefront OBJ format, as written by UnityPack's OBJMesh"""
+
+	def __init__(self, mesh, data=None):
+		self.mesh_data = data if data is not None else mesh_arrays(mesh)
+		self.mesh = mesh
+
+	@staticmethod
+	def face_format(coords, normals):
+		"""The format of a face line, with the vertex indices repeated for uvs/normals"""
+		vertex = "%d"
+		if coords and normals:
+			vertex = "%d/%d/%d"
+		elif coords:
+			vertex = "%d/%d"
+		elif normals:
+			vertex = "%d//%d"
+		return "f " + " ".join([vertex] * 3) + " \n", vertex.count("%d")
+
+	def export(self):
+		data = self.mesh_data
+		ret = []
+		normals = len(data.normals) > 0
+		tex_coords = data.dequantized("uv0", data.uv(0))
+		if not len(tex_coords):
+			tex_coords = data.dequantized("uv1", data.uv(1))
+
+		for v in flip_x(data.dequantized("vertices", data.vertices)).tolist():
+			ret.append("v %s %s %s\n" % tuple(v))
+		for v in flip_x(data.normals).tolist():
+			ret.append("vn %s %s %s\n" % tuple(v))
+		for v in flip_uv(tex_coords).tolist():
+			ret.append("vt %s %s\n" % tuple(v))
+		ret.append("\n")
+
+		# write group name and set smoothing to 1
+		ret.append("g %s\n" % (data.name))
+		ret.append("s 1\n")
+
+		face, repeat = self.face_format(len(tex_coords) > 0, normals)
+		sub_count = len(data.submeshes)
+		for i, triangles in enumerate(data.submeshes):
+			if sub_count == 1:
+				ret.append("usemtl %s\n" % (data.name))
+			else:
+				ret.append("usemtl %s_%d\n" % (data.name, i))
+			# reversed winding and one based, each index repeated per attribute
+			faces = triangle_list(triangles)[:, ::-1].astype(np.int64) + 1
+			faces = np.repeat(faces, repeat, axis=1)
+			ret.extend(face % tuple(f) for f in faces.tolist())
+			ret.append("\n")
+
+		return "".join(ret)
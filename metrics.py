@@ -0,0 +1,189 @@
+"""Timers and counters for the stages of a run
+
+The scripts record into the module level METRICS, split by stage:
+
+	load    opening bundles
+	read    reading objects from an asset
+	decode  decoding object data (images, meshes, shader blobs)
+	encode  encoding the output (png, mesh formats, yaml/json, glsl)
+	write   writing to the output sink
+
+Nothing is recorded until METRICS.enabled is set, by the --stats option, so
+the disabled timers cost a single attribute check. Time is also attributed
+to the bundle set with METRICS.bundle(), to see where it goes per bundle.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+
+STAGES = ["load", "read", "decode", "encode", "write"]
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+	__slots__ = ("metrics", "name", "start")
+
+	def __init__(self, metrics, name):
+		self.metrics = metrics
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+	def __init__(self):
+		self.enabled = False
+		self.lock = threading.Lock()
+		self.started = time.perf_counter()
+		self.current = None
+		self.reset()
+
+	def reset(self):
+		# name -> [calls, total seconds, max seconds]
+		self.timers = {}
+		self.counters = {}
+		# bundle -> {"timers": ..., "counters": ...}
+		self.bundles = {}
+
+	def _bundle(self):
+		if self.current is None:
+			return None
+		return self.bundles.setdefault(self.current, {"timers": {}, "counters": {}})
+
+	def timer(self, name):
+		"""Context manager adding the time spent in it to the timer name"""
+		if not self.enabled:
+			return _NULL_TIMER
+		return _Timer(self, name)
+
+	def add_time(self, name, seconds):
+		with self.lock:
+			for timers in (self.timers, (self._bundle() or {}).get("timers")):
+				if timers is None:
+					continue
+				t = timers.get(name)
+				if t is None:
+					timers[name] = [1, seconds, seconds]
+				else:
+					t[0] += 1
+					t[1] += seconds
+					if seconds > t[2]:
+						t[2] = seconds
+
+	def count(self, name, n=1):
+		if not self.enabled:
+			return
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+			bundle = self._bundle()
+			if bundle is not None:
+				bundle["counters"][name] = bundle["counters"].get(name, 0) + n
+
+	def bundle(self, name):
+		"""Context manager attributing everything recorded in it to bundle name"""
+		return _BundleScope(self, name)
+
+	def to_dict(self):
+		with self.lock:
+			return {
+				"wall": time.perf_counter() - self.started,
+				"timers": {k: list(v) for k, v in self.timers.items()},
+				"counters": dict(self.counters),
+				"bundles": json.loads(json.dumps(self.bundles)),
+			}
+
+	def merge(self, data):
+		"""Add the metrics of another process, as returned by to_dict()"""
+		def merge_into(timers, counters, other):
+			for name, (calls, total, longest) in other["timers"].items():
+				t = timers.setdefault(name, [0, 0.0, 0.0])
+				t[0] += calls
+				t[1] += total
+				t[2] = max(t[2], longest)
+			for name, n in other["counters"].items():
+				counters[name] = counters.get(name, 0) + n
+
+		with self.lock:
+			merge_into(self.timers, self.counters, data)
+			for name, other in data.get("bundles", {}).items():
+				bundle = self.bundles.setdefault(name, {"timers": {}, "counters": {}})
+				merge_into(bundle["timers"], bundle["counters"], other)
+
+	def table(self):
+		data = self.to_dict()
+		names = [s for s in STAGES if s in data["timers"]]
+		names += sorted(k for k in data["timers"] if k not in STAGES)
+		lines = ["%-12s %9s %11s %11s %11s" % ("stage", "calls", "total s", "mean ms", "max ms")]
+		for name in names:
+			calls, total, longest = data["timers"][name]
+			lines.append("%-12s %9i %11.3f %11.3f %11.3f" % (
+				name, calls, total, total / calls * 1000, longest * 1000
+			))
+		for name, n in sorted(data["counters"].items()):
+			lines.append("%-12s %9i" % (name, n))
+		if data["bundles"]:
+			lines.append("")
+			lines.append("%-32s" % ("bundle") + "".join("%10s" % (s) for s in STAGES))
+			for name, bundle in sorted(data["bundles"].items()):
+				row = "%-32s" % (name[:32])
+				for s in STAGES:
+					row += "%10.3f" % (bundle["timers"].get(s, [0, 0.0])[1])
+				lines.append(row)
+		lines.append("")
+		lines.append("wall time %.3fs" % (data["wall"]))
+		return "\n".join(lines)
+
+	def report(self, output="-"):
+		"""Print the summary table for "-", otherwise write json to output"""
+		if output == "-":
+			print(self.table(), file=sys.stderr)
+		else:
+			with open(output, "w") as f:
+				json.dump(self.to_dict(), f, indent=4)
+
+
+class _BundleScope:
+	def __init__(self, metrics, name):
+		self.metrics = metrics
+		self.name = name
+
+	def __enter__(self):
+		self.previous = self.metrics.current
+		self.metrics.current = self.name
+		return self
+
+	def __exit__(self, *exc):
+		self.metrics.current = self.previous
+
+
+METRICS = Metrics()
+
+timer = METRICS.timer
+count = METRICS.count
+
+
+def add_argument(parser):
+	"""Add the --stats option to an ArgumentParser"""
+	parser.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+		help="print a summary of the time spent per stage, or write it to FILE as json")
+
+
+def enable(args):
+	"""Start recording if --stats was given"""
+	METRICS.enabled = bool(getattr(args, "stats", None))
+	METRICS.started = time.perf_counter()
+
+
+def report(args):
+	if getattr(args, "stats", None):
+		METRICS.report(args.stats)
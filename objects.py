@@ -1,4 +1,8 @@
 class Vec2:
+	__slots__ = ("x", "y")
+	keys = ("x", "y")
+	precision = None
+
 	def __init__(self, x=0, y=0):
 		self.x = x
 		self.y = y
@@ -11,39 +15,65 @@ class Vec2:
 
 
 class Vec3(Vec2):
+	__slots__ = ("z",)
+	keys = ("x", "y", "z")
+	precision = 5
+
 	def __init__(self, x=0, y=0, z=0):
-		super().__init__(x, y)
+		self.x = x
+		self.y = y
 		self.z = z
 
 	def __str__(self):
 		return "({0:.5f}, {1:.5f}, {2:.5f})".format(self.x, self.y, self.z)
 
 	def to_json(self):
-		return { "x": float("{0:.5f}".format(self.x)), "y": float("{0:.5f}".format(self.y)), "z": float("{0:.5f}".format(self.z)) }
+		# round() is correctly rounded, same as formatting and reparsing
+		return { "x": round(float(self.x), 5), "y": round(float(self.y), 5), "z": round(float(self.z), 5) }
 
 
 class Vec4(Vec3):
+	__slots__ = ("w",)
+	keys = ("x", "y", "z", "w")
+	precision = 5
+
 	def __init__(self, x=0, y=0, z=0, w=0):
-		super().__init__(x, y, z)
+		self.x = x
+		self.y = y
+		self.z = z
 		self.w = w
 
 	def __str__(self):
 		return "({0:.5f}, {1:.5f}, {2:.5f}, {3:.5f})".format(self.x, self.y, self.z, self.w)
 
 	def to_json(self):
-		return { "x": float("{0:.5f}".format(self.x)), "y": float("{0:.5f}".format(self.y)), "z": float("{0:.5f}".format(self.z)), "w": float("{0:.5f}".format(self.w)) }
+		return { "x": round(float(self.x), 5), "y": round(float(self.y), 5), "z": round(float(self.z), 5), "w": round(float(self.w), 5) }
 
 
 class Color(Vec4):
-	def __init__(self, x=0, y=0, z=0, w=0):
-		super().__init__(x, y, z, w)
-		self.r = x
-		self.g = y
-		self.b = z
-		self.a = w
+	__slots__ = ()
+	keys = ("r", "g", "b", "a")
+	precision = None
 
-	def __str__(self):
-		return super().__str__()
+	r = property(lambda self: self.x)
+	g = property(lambda self: self.y)
+	b = property(lambda self: self.z)
+	a = property(lambda self: self.w)
 
 	def to_json(self):
-		return { "r": self.r, "g": self.g, "b": self.b, "a": self.a }
+		return { "r": self.x, "g": self.y, "b": self.z, "a": self.w }
+
+
+def vec_type(d):
+	"""The vector class matching the keys of a Unity vector/color dict"""
+	dim = len(d)
+	if dim == 2:
+		return Vec2
+	elif dim == 3:
+		return Vec3
+	elif dim == 4:
+		if "x" in d:
+			return Vec4
+		elif "r" in d:
+			return Color
+
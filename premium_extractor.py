@@ -1,12 +1,12 @@
 #!/usr/bin/env python
-import json
 import os
-import sys
 from argparse import ArgumentParser
 from PIL import Image, ImageOps
 from unitypack.environment import UnityEnvironment
 
-from utils import vec_from_dict, write_to_file
+import cli
+import metrics
+from utils import dump_json, vec_from_dict, write_to_file
 
 """Based on HearthSim/HearthstoneJSON generate_card_textures.py"""
 
@@ -158,7 +158,8 @@ def extract_info(files, filter_ids):
 	for file in files:
 		#print("Reading %r" % (file))
 		f = open(file, "rb")
-		env.load(f)
+		with metrics.timer("load"):
+			env.load(f)
 
 	for bundle in env.bundles.values():
 		for asset in bundle.assets:
@@ -231,21 +232,15 @@ def do_texture(path, id, textures, values, thumb_sizes, args):
 				thumb_texture.save(filename)
 
 
-class VectorEncoder(json.JSONEncoder):
-	def default(self, obj):
-		if hasattr(obj, "to_json"):
-			return obj.to_json()
-		else:
-			info(f"{obj} does not implement to_json()")
-			return json.JSONEncoder.default(self, obj)
-
-
 def main():
 	p = ArgumentParser()
 	p.add_argument("--only", type=str, nargs="?", help="Extract specific IDs")
+	p.add_argument("--compact", action="store_true",
+		help="write the material json without indentation")
 	p.add_argument("files", nargs="+")
 	p.add_argument("outdir")
-	args = p.parse_args(sys.argv[1:])
+	cli.add_arguments(p)
+	args = cli.parse_args(p)
 
 	filter_ids = args.only.split(",") if args.only else []
 
@@ -301,7 +296,8 @@ def main():
 				continue
 			texture_obj = tptr.resolve()
 			filename, exists = get_filename(args.outdir, id, texture_obj.name, ext=".png")
-			texture_obj.image.save(filename)
+			with metrics.timer("encode"):
+				texture_obj.image.save(filename)
 			prem_obj[tname] = {}
 			prem_obj[tname]["texture"] = texture_obj.name
 			prem_obj[tname]["scale"] = vec_from_dict(v["m_Scale"])
@@ -314,7 +310,7 @@ def main():
 			prem_obj[cname] = vec_from_dict(v)
 
 		filename, exists = get_filename(args.outdir, id, id, ext=".json")
-		write_to_file(filename, json.dumps(prem_obj, cls=VectorEncoder, indent=4))
+		write_to_file(filename, dump_json(prem_obj, compact=args.compact))
 
 		# premium port path
 		prem_port_path = values["prem_port"]
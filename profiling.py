@@ -0,0 +1,62 @@
+"""Run part of a script under cProfile or tracemalloc
+
+cprofile writes a .pstats file, readable by pstats, snakeviz or flameprof
+(for flame graphs). tracemalloc writes the snapshot, to load with
+tracemalloc.Snapshot.load(), and a .txt summary of the top allocations.
+"""
+
+import os
+import time
+
+
+MODES = ["cprofile", "tracemalloc"]
+
+# stack depth kept for each allocation, in tracemalloc mode
+TRACEMALLOC_FRAMES = 25
+
+
+class Profiler:
+	def __init__(self, mode, output_dir, name):
+		if mode not in MODES:
+			raise ValueError("Unsupported profiler %r" % (mode))
+		self.mode = mode
+		self.output_dir = output_dir
+		self.name = name
+		self.profile = None
+
+	def start(self):
+		if self.mode == "cprofile":
+			import cProfile
+
+			self.profile = cProfile.Profile()
+			self.profile.enable()
+		else:
+			import tracemalloc
+
+			tracemalloc.start(TRACEMALLOC_FRAMES)
+
+	def stop(self):
+		"""Stop profiling, return the path of the file written"""
+		os.makedirs(self.output_dir, exist_ok=True)
+		stamp = time.strftime("%Y%m%d-%H%M%S")
+		# the pid keeps the profiles of parallel workers apart
+		path = os.path.join(self.output_dir, "%s-%s-%i" % (self.name, stamp, os.getpid()))
+
+		if self.mode == "cprofile":
+			self.profile.disable()
+			path += ".pstats"
+			self.profile.dump_stats(path)
+			self.profile = None
+			return path
+
+		import tracemalloc
+
+		snapshot = tracemalloc.take_snapshot()
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		snapshot.dump(path + ".tracemalloc")
+		with open(path + ".txt", "w") as f:
+			f.write("peak %.1f KiB\n\n" % (peak / 1024))
+			for stat in snapshot.statistics("lineno")[:50]:
+				f.write("%s\n" % (stat))
+		return path + ".tracemalloc"
@@ -0,0 +1,225 @@
+"""Progress of long runs, with throughput and an estimated time left
+
+The totals, of the work left to do, are counted up front from the bundles'
+object tables (or taken from scheduler.plan(), which reads them anyway),
+then the scripts report each object (and its size) as it is done:
+
+	progress.start(progress.count_objects(files, types, done))
+	...
+	progress.update(size)
+	progress.bundle_done()
+	...
+	progress.finish()
+
+Worker processes report through a queue instead, see worker_queue() and
+attach(), which the parent process adds to its own totals.
+"""
+
+import sys
+import threading
+import time
+from collections import namedtuple
+
+
+Totals = namedtuple("Totals", "bundles objects bytes")
+
+# seconds between two progress lines
+INTERVAL = 1.0
+
+
+def count_objects(files, types=None, done=None):
+	"""Totals for the objects of the given types (or all) in the files
+
+	With done, a Checkpoint, the objects it has are left out.
+	"""
+	import unitypack
+	from utils import filename_no_ext
+
+	objects = size = 0
+	for file in files:
+		name = filename_no_ext(file)
+		with open(file, "rb") as f:
+			bundle = unitypack.load(f)
+			for asset in bundle.assets:
+				for id, obj in asset.objects.items():
+					try:
+						if types is not None and obj.type not in types:
+							continue
+					except Exception:
+						continue
+					if done and done.object_done(name, asset.name, id):
+						continue
+					objects += 1
+					size += obj.size
+	return Totals(len(files), objects, size)
+
+
+def format_duration(seconds):
+	seconds = int(seconds)
+	return "%i:%02i:%02i" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Progress:
+	def __init__(self, totals, stream=None, interval=INTERVAL):
+		self.totals = totals
+		self.stream = stream or sys.stderr
+		self.interval = interval
+		self.tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+		self.lock = threading.Lock()
+		self.bundles = 0
+		self.objects = 0
+		self.bytes = 0
+		self.started = time.perf_counter()
+		self.last = 0.0
+
+	def update(self, size=0, objects=1):
+		with self.lock:
+			self.objects += objects
+			self.bytes += size
+		self.report()
+
+	def bundle_done(self, bundles=1):
+		with self.lock:
+			self.bundles += bundles
+		self.report()
+
+	def line(self):
+		elapsed = max(time.perf_counter() - self.started, 1e-9)
+		totals = self.totals
+		rate = self.objects / elapsed
+		byte_rate = self.bytes / elapsed
+		# the sizes are a better measure of the work left than the counts
+		if totals.bytes and self.bytes:
+			left = (totals.bytes - self.bytes) / byte_rate
+		elif totals.objects and self.objects:
+			left = (totals.objects - self.objects) / rate
+		else:
+			left = None
+		return "[%i/%i bundles] %i/%i objects  %.1f objects/s  %.2f MB/s  ETA %s" % (
+			self.bundles, totals.bundles, self.objects, totals.objects,
+			rate, byte_rate / 1e6,
+			format_duration(max(left, 0)) if left is not None else "-",
+		)
+
+	def report(self, force=False):
+		now = time.perf_counter()
+		if not force and now - self.last < self.interval:
+			return
+		with self.lock:
+			self.last = now
+			line = self.line()
+			if self.tty:
+				self.stream.write("\r" + line + "\033[K")
+			else:
+				self.stream.write(line + "\n")
+			self.stream.flush()
+
+	def finish(self):
+		self.report(force=True)
+		if self.tty:
+			self.stream.write("\n")
+		self.stream.write("done in %s\n" % (format_duration(time.perf_counter() - self.started)))
+		self.stream.flush()
+
+
+class QueueReporter:
+	"""Collects a worker's updates, sent to the parent's queue in batches"""
+
+	def __init__(self, queue, interval=INTERVAL / 2):
+		self.queue = queue
+		self.interval = interval
+		self.lock = threading.Lock()
+		self.pending = [0, 0, 0]
+		self.last = time.perf_counter()
+
+	def update(self, size=0, objects=1):
+		with self.lock:
+			self.pending[0] += objects
+			self.pending[1] += size
+		if time.perf_counter() - self.last >= self.interval:
+			self.flush()
+
+	def bundle_done(self, bundles=1):
+		with self.lock:
+			self.pending[2] += bundles
+		self.flush()
+
+	def flush(self):
+		with self.lock:
+			if any(self.pending):
+				self.queue.put(tuple(self.pending))
+			self.pending = [0, 0, 0]
+			self.last = time.perf_counter()
+
+
+# the reporter of this process, if any
+REPORTER = None
+
+
+def start(totals, stream=None):
+	global REPORTER
+	REPORTER = Progress(totals, stream)
+	return REPORTER
+
+
+def update(size=0, objects=1):
+	if REPORTER is not None:
+		REPORTER.update(size, objects)
+
+
+def bundle_done():
+	if REPORTER is not None:
+		REPORTER.bundle_done()
+
+
+def flush():
+	"""Send a worker's pending updates"""
+	if isinstance(REPORTER, QueueReporter):
+		REPORTER.flush()
+
+
+def finish():
+	global REPORTER
+	if isinstance(REPORTER, Progress):
+		REPORTER.finish()
+	REPORTER = None
+
+
+def worker_queue(context=None):
+	"""A queue for the workers' updates, applied to this process' progress
+
+	Returns (queue, stop), pass queue to attach() in each worker and call
+	stop() once the workers are done.
+	"""
+	import multiprocessing
+
+	queue = (context or multiprocessing).Queue()
+	progress = REPORTER
+
+	def listen():
+		while True:
+			update = queue.get()
+			if update is None:
+				break
+			if progress is not None:
+				objects, size, bundles = update
+				with progress.lock:
+					progress.objects += objects
+					progress.bytes += size
+					progress.bundles += bundles
+				progress.report()
+
+	thread = threading.Thread(target=listen, daemon=True)
+	thread.start()
+
+	def stop():
+		queue.put(None)
+		thread.join()
+
+	return queue, stop
+
+
+def attach(queue):
+	"""Report through the parent's queue, in a worker process"""
+	global REPORTER
+	REPORTER = QueueReporter(queue)
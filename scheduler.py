@@ -0,0 +1,307 @@
+"""Spread the work on a set of bundles over worker processes
+
+The cost of each bundle is estimated from its object table (the sizes of
+the objects to process, plus a fixed overhead per object), or the file size
+when the table isn't read. Bundles costing more than a fair share are split
+into tasks over ranges of their objects, so the longest task is bounded by
+the largest object rather than the largest bundle. Assets with objects of
+the whole_types given (those of grouped handlers, whose finish function
+works on all the asset's objects at once) are kept in a single task.
+
+Tasks are dealt largest first to a deque per worker, balancing the total
+cost of each. A dispatcher thread per worker feeds its deque to the process
+pool one task at a time, and once it runs dry steals the largest task left
+in the busiest deque.
+"""
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import progress
+import utils
+
+
+(debug, info, error) = utils.Echo.echo()
+
+# the estimated cost of an object, besides its size (in bytes)
+OBJECT_COST = 16 * 1024
+
+# tasks per worker aimed for, when splitting bundles
+TASKS_PER_WORKER = 4
+
+# bundles are never split in tasks smaller than this
+MIN_TASK_COST = 8 * 1024 * 1024
+
+
+class Task:
+	"""Objects of a bundle to process, all of them or a range of them"""
+
+	def __init__(self, path, cost, objects=None, part=0, parts=1, count=None, size=None):
+		self.path = path
+		self.name = utils.filename_no_ext(path)
+		self.cost = cost
+		# [(index of the asset in bundle.assets, [ids])], None for everything
+		self.objects = objects
+		self.part = part
+		self.parts = parts
+		# the number and total size of its objects, None without the table
+		self.count = count
+		self.size = size
+
+	def __repr__(self):
+		return "Task(name={}, part={}/{}, cost={})".format(
+			self.name, self.part + 1, self.parts, self.cost
+		)
+
+
+def task_assets(bundle, task):
+	"""(asset, ids) for the objects of task in the loaded bundle, ids None for all"""
+	if task.objects is None:
+		return [(asset, None) for asset in bundle.assets]
+	return [(bundle.assets[index], ids) for index, ids in task.objects]
+
+
+def object_table(path, types=None, done=None, whole_types=()):
+	"""[(asset index, [(id, size)], whole)] for the objects to process in the
+	bundle, whole if the asset has objects of whole_types"""
+	import unitypack
+
+	name = utils.filename_no_ext(path)
+	table = []
+	with open(path, "rb") as f:
+		bundle = unitypack.load(f)
+		for index, asset in enumerate(bundle.assets):
+			objects = []
+			whole = False
+			for id, obj in asset.objects.items():
+				try:
+					otype = obj.type
+				except Exception:
+					continue
+				if types is not None and otype not in types:
+					continue
+				if done and done.object_done(name, asset.name, id):
+					continue
+				whole = whole or otype in whole_types
+				objects.append((id, obj.size))
+			table.append((index, objects, whole))
+	return table
+
+
+def split(path, table, target):
+	"""Tasks over consecutive objects of the bundle, costing about target"""
+	ranges = []
+	objects, cost, count, total = [], 0, 0, 0
+	for index, sizes, whole in table:
+		ids = []
+		# the objects of a whole asset are a single unit
+		units = [sizes] if whole else [[s] for s in sizes]
+		for unit in units:
+			for id, size in unit:
+				ids.append(id)
+				cost += size + OBJECT_COST
+				count += 1
+				total += size
+			if cost >= target:
+				objects.append((index, ids))
+				ranges.append((objects, cost, count, total))
+				objects, ids, cost, count, total = [], [], 0, 0, 0
+		if ids:
+			objects.append((index, ids))
+	if objects or not ranges:
+		# a bundle with nothing left still gets a task, to be marked done
+		ranges.append((objects, cost, count, total))
+	return [
+		Task(path, cost, objects, part, len(ranges), count, total)
+		for part, (objects, cost, count, total) in enumerate(ranges)
+	]
+
+
+def plan(files, workers, types=None, split_bundles=True, done=None, whole_types=()):
+	"""The tasks for files, bundles larger than a fair share are split
+
+	Without split_bundles, there is a task per bundle costed by file size.
+	With done, a Checkpoint, the objects it has are left out of the tasks.
+	Assets with objects of whole_types are never split.
+	"""
+	if not split_bundles:
+		return [Task(f, os.path.getsize(f)) for f in files]
+
+	tables = {}
+	costs = {}
+	for f in files:
+		try:
+			tables[f] = object_table(f, types, done, whole_types)
+			costs[f] = sum(
+				size + OBJECT_COST for index, sizes, whole in tables[f] for id, size in sizes
+			)
+		except Exception as e:
+			error("Could not read the objects of %s (%s)", f, e)
+			costs[f] = os.path.getsize(f)
+
+	total = sum(costs.values())
+	target = max(total / (workers * TASKS_PER_WORKER), MIN_TASK_COST)
+	tasks = []
+	for f in files:
+		if f in tables and costs[f] > target:
+			tasks.extend(split(f, tables[f], target))
+		elif f in tables and done:
+			# only the pending objects
+			tasks.extend(split(f, tables[f], float("inf")))
+		elif f in tables:
+			sizes = [size for index, sizes, whole in tables[f] for id, size in sizes]
+			tasks.append(Task(f, costs[f], count=len(sizes), size=sum(sizes)))
+		else:
+			tasks.append(Task(f, costs[f]))
+	return tasks
+
+
+def totals(tasks):
+	"""progress.Totals of the tasks, from the object tables plan() read
+
+	None when a bundle's table wasn't read, its objects have to be counted.
+	"""
+	if any(task.count is None for task in tasks):
+		return None
+	return progress.Totals(
+		len({task.name for task in tasks}),
+		sum(task.count for task in tasks),
+		sum(task.size for task in tasks),
+	)
+
+
+class WorkQueues:
+	"""A deque of tasks per worker, largest first, with work stealing"""
+
+	def __init__(self, tasks, workers):
+		self.lock = threading.Lock()
+		self.queues = [deque() for i in range(workers)]
+		self.loads = [0] * workers
+		# longest processing time first, to the least loaded worker
+		for task in sorted(tasks, key=lambda t: t.cost, reverse=True):
+			i = self.loads.index(min(self.loads))
+			self.queues[i].append(task)
+			self.loads[i] += task.cost
+
+	def next(self, worker):
+		"""The next task for worker, stolen from another when it has none"""
+		with self.lock:
+			queue = self.queues[worker]
+			if not queue:
+				victim = self.loads.index(max(self.loads))
+				queue = self.queues[victim]
+				if not queue:
+					return None
+				worker = victim
+			task = queue.popleft()
+			self.loads[worker] -= task.cost
+			return task
+
+
+def _init_worker(stats, progress_queue, setup, setup_args):
+	metrics.METRICS.enabled = stats
+	if progress_queue is not None:
+		progress.attach(progress_queue)
+	if setup:
+		setup(*setup_args)
+
+
+def _run_task(func, task):
+	# each task reports its own metrics, merged by the parent process
+	metrics.METRICS.reset()
+	result = func(task)
+	# pool workers exit without flushing their buffers
+	utils.Echo.flush()
+	progress.flush()
+	return result, metrics.METRICS.to_dict()
+
+
+def run(tasks, func, workers, setup=None, setup_args=(), on_result=None, on_error=None):
+	"""Run func(task) for each task in a pool of worker processes
+
+	func and setup, called once in each worker, must be picklable (module
+	level functions or partials of them). on_result(task, result), or
+	on_error(task, exception) for a task that raised, is called in this
+	process, one at a time, as tasks complete.
+	"""
+	queues = WorkQueues(tasks, workers)
+	stats = metrics.METRICS.enabled
+	progress_queue = stop_progress = None
+	if progress.REPORTER is not None:
+		progress_queue, stop_progress = progress.worker_queue()
+	lock = threading.Lock()
+	# don't let the workers inherit, and repeat, buffered messages
+	utils.Echo.flush()
+
+	with ProcessPoolExecutor(
+		workers, initializer=_init_worker,
+		initargs=(stats, progress_queue, setup, setup_args)
+	) as executor:
+		def dispatch(worker):
+			while True:
+				task = queues.next(worker)
+				if task is None:
+					return
+				try:
+					result, data = executor.submit(_run_task, func, task).result()
+				except Exception as e:
+					error("Error: %r %s", task, e, bundle=task.name)
+					if on_error:
+						with lock:
+							on_error(task, e)
+					continue
+				with lock:
+					if stats:
+						metrics.METRICS.merge(data)
+					if on_result:
+						on_result(task, result)
+
+		threads = [
+			threading.Thread(target=dispatch, args=(i,), daemon=True)
+			for i in range(workers)
+		]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+	if stop_progress:
+		stop_progress()
+
+
+class BundleTracker:
+	"""Calls done(name) once all the tasks of a bundle have completed or failed
+
+	The bundles with a failed task are in incomplete, they must not be
+	recorded as finished.
+	"""
+
+	def __init__(self, tasks, done):
+		self.remaining = {}
+		for task in tasks:
+			self.remaining[task.name] = self.remaining.get(task.name, 0) + 1
+		self.done = done
+		self.incomplete = set()
+
+	def task_done(self, task):
+		self.remaining[task.name] -= 1
+		if not self.remaining[task.name]:
+			self.done(task.name)
+
+	def task_failed(self, task, e=None):
+		self.incomplete.add(task.name)
+		self.task_done(task)
+
+	def report(self):
+		"""Log the bundles left unfinished"""
+		if self.incomplete:
+			names = sorted(self.incomplete)
+			error("Unfinished bundles: %s", ", ".join(names), bundles=names)
+
+
+def add_argument(parser):
+	parser.add_argument("--jobs", "-j", type=int, default=1,
+		help="number of worker processes")
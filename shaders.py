@@ -7,6 +7,7 @@ from operator import attrgetter
 import unitypack
 from unitypack.engine.object import field
 import mojoparser
+import metrics
 import utils
 import glsl_parser
 from glsl_objects import Define, Declare, Assignment
@@ -216,17 +217,22 @@ def clean_up(parsed_data, tags):
 	return glsl_parser.build(parsed_glsl, version="300", keywords=tags, declarations=declarations)
 
 
-def extract_shader(shader, dir, raw=False):
+def extract_shader(shader, dir, raw=False, sink=None):
+	from sinks import DirectorySink
+
 	if not shader_has_compatible_props(shader):
 		error("The shader asset has an unsupported format")
 		return
 
+	# default to writing directly to the filesystem
+	if sink is None:
+		sink = DirectorySink()
+
 	# create output path for each shader
 	name = os.path.basename(shader.parsed_form.name)
 	path = os.path.normpath(os.path.join(dir, shader.parsed_form.name))
-	os.makedirs(path, exist_ok=True)
 
-	info(f"Extracting '{shader.parsed_form.name}'")
+	info("Extracting '%s'", shader.parsed_form.name, shader=shader.parsed_form.name)
 	compressed = unitypack.utils.BinaryReader(BytesIO(shader.blob))
 	# check blob sizes and offsets match up
 	assert compressed.buf.getbuffer().nbytes == sum(shader.compressed_sizes)
@@ -239,9 +245,10 @@ def extract_shader(shader, dir, raw=False):
 	for i, s in enumerate(shader.compressed_sizes):
 		# decompress lz4 frame
 		compressed.seek(shader.compressed_offsets[i])
-		uncompressed = unitypack.utils.lz4_decompress(
-			compressed.read(s), shader.decompressed_sizes[i]
-		)
+		with metrics.timer("decode"):
+			uncompressed = unitypack.utils.lz4_decompress(
+				compressed.read(s), shader.decompressed_sizes[i]
+			)
 		data = unitypack.utils.BinaryReader(BytesIO(uncompressed))
 		# read header for subshader offsets and lengths
 		index = []
@@ -262,7 +269,7 @@ def extract_shader(shader, dir, raw=False):
 			if stype_id in shader_type_map:
 				stype = shader_type_map[stype_id]
 			if stype == None:
-				info(f"Skipping unsupported type ({stype}) @ {offset}")
+				info("Skipping unsupported type (%s) @ %s", stype, offset)
 				continue
 			# XXX unknown series of bytes (12)
 			u1, u2, u3 = (b.read_int(), b.read_int(), b.read_int())
@@ -276,7 +283,7 @@ def extract_shader(shader, dir, raw=False):
 				size = b.read_int()
 				keywords.append(b.read_string(size))
 				b.align()
-			debug(f"subprogram ({stype}) @ {offset} [{' '.join(keywords)}]")
+			debug("subprogram (%s) @ %s [%s]", stype, offset, utils.Lazy(" ".join, keywords))
 			# read the bytecode data
 			raw_data = b.read(b.read_int())
 
@@ -289,10 +296,11 @@ def extract_shader(shader, dir, raw=False):
 			# disassemble DX9 bytecode
 			if stype.api == API.D3D9:
 				try:
-					parsed_data = bytecode_parser.parse(raw_data, mojoparser.Profile.GLSL110)
+					with metrics.timer("decode"):
+						parsed_data = bytecode_parser.parse(raw_data, mojoparser.Profile.GLSL110)
 				except mojoparser.ParseFailureError as err:
-					error(f"'{name}': {err}")
-					debug("\n".join(err.errors))
+					error("'%s': %s", name, err, shader=name)
+					debug("%s", utils.Lazy("\n".join, err.errors))
 					continue
 			# set the filename
 			filename = os.path.join(path, f"{name}.{stype.api}.{offset}")
@@ -300,13 +308,14 @@ def extract_shader(shader, dir, raw=False):
 			# process DX9 shaders only
 			if stype.api == API.D3D9:
 				# final clean up to prepare glsl for webgl
-				prog_text = clean_up(parsed_data, keywords)
+				with metrics.timer("encode"):
+					prog_text = clean_up(parsed_data, keywords)
 				# write to file
-				utils.write_to_file(filename + ext, prog_text)
+				sink.write(filename + ext, prog_text)
 			# write keywords to file
 			if keywords:
-				utils.write_to_file(filename + ".tags", "\n".join(keywords))
+				sink.write(filename + ".tags", "\n".join(keywords))
 			# write full subshader blob
 			if raw:
-				utils.write_to_file(filename + ".bin", sub_bytes, "wb")
-				utils.write_to_file(filename + ".co", raw_data, "wb")
+				sink.write(filename + ".bin", sub_bytes, "wb")
+				sink.write(filename + ".co", raw_data, "wb")
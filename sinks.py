@@ -0,0 +1,218 @@
+"""Output sinks for extracted files
+
+A sink receives paths relative to its root and the contents to store there.
+The directory sink keeps the original behaviour of one file per object, the
+archive sinks stream everything for a bundle into a single tar or zip file.
+"""
+
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO
+
+import metrics
+import utils
+
+
+ARCHIVE_FORMATS = ["tar", "tar.gz", "tar.xz", "tar.zst", "zip"]
+
+# in-memory limit for streamed entries, before spilling to disk
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class Sink:
+	"""Base class for all sinks"""
+
+	def __init__(self, root=""):
+		self.root = root
+		self.lock = threading.Lock()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def write(self, path, contents, mode="w"):
+		"""Store contents at path, mode follows open() ("w" or "wb")"""
+		raise NotImplementedError()
+
+	def open(self, path, mode="wb"):
+		"""Return a writable file object, the entry is stored when closed"""
+		raise NotImplementedError()
+
+	def close(self):
+		pass
+
+
+class DirectorySink(Sink):
+	"""Write each entry as a separate file under root"""
+
+	def write(self, path, contents, mode="w"):
+		path = os.path.join(self.root, path)
+		with metrics.timer("write"):
+			utils.make_dirs(path)
+			written = utils.write_to_file(path, contents, mode=mode)
+		metrics.count("files")
+		metrics.count("bytes written", written)
+
+	def open(self, path, mode="wb"):
+		path = os.path.join(self.root, path)
+		utils.make_dirs(path)
+		return _CountedFile(open(path, "wb"), mode)
+
+
+class _CountedFile:
+	"""File object counting the file and its bytes once it is closed"""
+
+	def __init__(self, file, mode):
+		self.file = file
+		self.binary = "b" in mode
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def write(self, data):
+		if not self.binary:
+			data = data.encode("utf-8")
+		with metrics.timer("write"):
+			return self.file.write(data)
+
+	def close(self):
+		if self.file is None:
+			return
+		size = self.file.tell()
+		self.file.close()
+		self.file = None
+		metrics.count("files")
+		metrics.count("bytes written", size)
+
+
+class _SpooledEntry:
+	"""File object buffering an archive entry until it is closed"""
+
+	def __init__(self, sink, path, mode):
+		self.sink = sink
+		self.path = path
+		self.binary = "b" in mode
+		self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def write(self, data):
+		if not self.binary:
+			data = data.encode("utf-8")
+		return self.file.write(data)
+
+	def close(self):
+		if self.file is None:
+			return
+		size = self.file.tell()
+		self.file.seek(0)
+		with metrics.timer("write"):
+			self.sink._add(self.path, self.file, size)
+		metrics.count("files")
+		metrics.count("bytes written", size)
+		self.file.close()
+		self.file = None
+
+
+class ArchiveSink(Sink):
+	"""Common behaviour of the archive sinks, entries are added under a lock"""
+
+	def _add(self, path, fileobj, size):
+		raise NotImplementedError()
+
+	def write(self, path, contents, mode="w"):
+		if "b" not in mode:
+			contents = contents.encode("utf-8")
+		with metrics.timer("write"):
+			self._add(path, BytesIO(contents), len(contents))
+		metrics.count("files")
+		metrics.count("bytes written", len(contents))
+		utils.Echo.debug("Written %i bytes to %r", len(contents), path, path=path, bytes=len(contents))
+
+	def open(self, path, mode="wb"):
+		return _SpooledEntry(self, path, mode)
+
+
+class TarSink(ArchiveSink):
+	"""Stream entries into a tar file, optionally compressed"""
+
+	def __init__(self, path, compression=None):
+		super().__init__(path)
+		self.zstd = None
+		if compression == "zst":
+			try:
+				import zstandard
+			except ImportError:
+				raise RuntimeError("zstandard is required to write .tar.zst archives")
+			self.file = open(path, "wb")
+			self.zstd = zstandard.ZstdCompressor().stream_writer(self.file)
+			self.tar = tarfile.open(fileobj=self.zstd, mode="w|")
+		else:
+			self.file = None
+			self.tar = tarfile.open(path, "w|" + (compression or ""))
+
+	def _add(self, path, fileobj, size):
+		info = tarfile.TarInfo(path.replace(os.sep, "/"))
+		info.size = size
+		info.mtime = time.time()
+		with self.lock:
+			self.tar.addfile(info, fileobj)
+
+	def close(self):
+		self.tar.close()
+		if self.zstd:
+			self.zstd.close()
+		if self.file:
+			self.file.close()
+
+
+class ZipSink(ArchiveSink):
+	"""Stream entries into a zip file"""
+
+	def __init__(self, path, compression=zipfile.ZIP_DEFLATED):
+		super().__init__(path)
+		self.zip = zipfile.ZipFile(path, "w", compression=compression)
+
+	def _add(self, path, fileobj, size):
+		with self.lock:
+			with self.zip.open(path.replace(os.sep, "/"), "w", force_zip64=True) as f:
+				while True:
+					chunk = fileobj.read(1024 * 1024)
+					if not chunk:
+						break
+					f.write(chunk)
+
+	def close(self):
+		self.zip.close()
+
+
+def open_sink(output, name, archive=None):
+	"""Create the sink for the bundle called name, under the output dir
+
+	With no archive format, files are written to the directory output/name,
+	otherwise a single output/name.<archive> file is created.
+	"""
+	if not archive:
+		return DirectorySink(os.path.join(output, name))
+
+	if archive not in ARCHIVE_FORMATS:
+		raise ValueError("Unsupported archive format %r" % (archive))
+	path = os.path.join(output, name + "." + archive)
+	utils.make_dirs(path)
+	if archive == "zip":
+		return ZipSink(path)
+	compression = archive[4:] if archive.startswith("tar.") else None
+	return TarSink(path, compression)
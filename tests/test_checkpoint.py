@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+from types import SimpleNamespace
+
+import utils
+from checkpoint import Checkpoint, Recorder, open_checkpoint
+
+
+OPTIONS = {"types": ["Mesh"], "archive": None}
+
+
+def run_args(resume=False, restart=False, checkpoint=None):
+	return Namespace(resume=resume, restart=restart, checkpoint=checkpoint)
+
+
+class CheckpointTest(unittest.TestCase):
+	def setUp(self):
+		self.output = tempfile.mkdtemp()
+		utils.Echo.hide_errors = True
+
+	def tearDown(self):
+		utils.Echo.hide_errors = False
+		shutil.rmtree(self.output)
+
+	def first_run(self, args=None):
+		with open_checkpoint(args or run_args(), self.output, "extract", OPTIONS) as done:
+			done.mark_bundle("cards0")
+			done.mark_objects("cards1", "CAB-1", [1, 2])
+
+	def test_plain_rerun_starts_over(self):
+		self.first_run()
+		with open_checkpoint(run_args(), self.output, "extract", OPTIONS) as done:
+			self.assertFalse(done.bundle_done("cards0"))
+			self.assertFalse(done.object_done("cards1", "CAB-1", 1))
+
+	def test_resume(self):
+		self.first_run()
+		with open_checkpoint(run_args(resume=True), self.output, "extract", OPTIONS) as done:
+			self.assertTrue(done.bundle_done("cards0"))
+			self.assertTrue(done.object_done("cards1", "CAB-1", 2))
+			self.assertFalse(done.object_done("cards1", "CAB-1", 3))
+
+	def test_resume_other_options(self):
+		self.first_run()
+		options = dict(OPTIONS, types=["Sprite"])
+		with self.assertRaises(SystemExit):
+			open_checkpoint(run_args(resume=True), self.output, "extract", options)
+
+	def test_explicit_checkpoint_is_kept(self):
+		path = os.path.join(self.output, "run.checkpoint")
+		self.first_run(run_args(checkpoint=path))
+		with self.assertRaises(SystemExit):
+			open_checkpoint(run_args(checkpoint=path), self.output, "extract", OPTIONS)
+		with open_checkpoint(run_args(restart=True, checkpoint=path), self.output, "extract", OPTIONS) as done:
+			self.assertFalse(done.bundle_done("cards0"))
+
+	def test_cut_short_line_is_ignored(self):
+		path = os.path.join(self.output, "run.checkpoint")
+		self.first_run(run_args(checkpoint=path))
+		with open(path, "a", encoding="utf-8") as f:
+			f.write("cards1\tCAB-1\t3")
+		with Checkpoint(path, OPTIONS, resume=True) as done:
+			self.assertTrue(done.object_done("cards1", "CAB-1", 1))
+			self.assertFalse(done.object_done("cards1", "CAB-1", 3))
+
+
+class RecorderTest(unittest.TestCase):
+	def test_apply(self):
+		output = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, output)
+		recorder = Recorder()
+		asset = SimpleNamespace(name="CAB-1")
+		self.assertEqual(recorder.pending(asset, [1, 2]), [1, 2])
+		recorder.mark(asset, [1])
+		recorder.mark(asset, [])
+		with Checkpoint(os.path.join(output, "run.checkpoint")) as done:
+			recorder.apply(done, "cards1")
+			self.assertTrue(done.object_done("cards1", "CAB-1", 1))
+			self.assertFalse(done.object_done("cards1", "CAB-1", 2))
@@ -0,0 +1,72 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import json
+
+from meshes import BabylonMesh, JSONMesh, MeshArrays, OBJMesh, quantize, read_indices, tipsify
+
+
+def truncated_mesh():
+	"""A mesh whose submesh has 10 indices, 3 triangles and a partial one"""
+	indices = np.array([0, 1, 2, 1, 2, 3, 2, 3, 0, 3], dtype="<u2")
+	sub = SimpleNamespace(topology=0, index_count=len(indices), first_byte=0)
+	return SimpleNamespace(
+		name="truncated", _obj={}, index_buffer=indices.tobytes(), submeshes=[sub]
+	)
+
+
+def arrays(submeshes):
+	vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float64)
+	normals = np.tile([0.0, 0.0, 1.0], (4, 1))
+	uvs = [vertices[:, :2].copy()]
+	return MeshArrays("truncated", vertices, normals, uvs=uvs, submeshes=submeshes)
+
+
+class TruncatedIndicesTest(unittest.TestCase):
+	def test_read_indices_drops_partial_triangle(self):
+		submeshes = read_indices(truncated_mesh())
+		self.assertEqual([len(s) for s in submeshes], [9])
+
+	def test_exporters_drop_partial_triangle(self):
+		data = arrays([np.array([0, 1, 2, 1, 2, 3, 2, 3, 0, 3])])
+		obj = OBJMesh(None, data).export()
+		self.assertEqual(obj.count("\nf "), 3)
+		JSONMesh(None, data).export()
+
+
+class TipsifyTest(unittest.TestCase):
+	def test_keeps_triangles_on_vertex_zero(self):
+		triangles = np.array([[1, 2, 3], [0, 0, 0]])
+		self.assertEqual(len(tipsify(triangles, 4)), 2)
+
+
+class BabylonQuantizedTest(unittest.TestCase):
+	def test_positions_are_dequantized(self):
+		data = arrays([np.array([0, 1, 2, 2, 3, 0])])
+		mesh = json.loads(BabylonMesh(None, quantize(data)).export())["meshes"][0]
+		expected = json.loads(BabylonMesh(None, data).export())["meshes"][0]
+		self.assertNotIn("positionsQuantization", mesh)
+		np.testing.assert_allclose(mesh["positions"], expected["positions"], atol=1e-4)
+		np.testing.assert_allclose(mesh["uvs"], expected["uvs"], atol=1e-4)
+
+
+class JSONQuantizedTest(unittest.TestCase):
+	def test_quantized_attributes_match_floats(self):
+		data = arrays([np.array([0, 1, 2, 2, 3, 0])])
+		mesh = json.loads(JSONMesh(None, quantize(data)).export())
+		expected = json.loads(JSONMesh(None, data).export())
+		self.assertTrue(all(0 <= v <= 0xFFFF and v == int(v) for v in mesh["vertices"]))
+
+		params = mesh["verticesQuantization"]
+		positions = np.array(mesh["vertices"]).reshape(-1, 3) * params["scale"] + params["offset"]
+		np.testing.assert_allclose(positions.ravel(), expected["vertices"], atol=1e-4)
+
+		params = mesh["uvsQuantization"][0]
+		uvs = np.array(mesh["uvs"][0]).reshape(-1, 2) * params["scale"] + params["offset"]
+		np.testing.assert_allclose(uvs.ravel(), expected["uvs"][0], atol=1e-4)
+
+
+if __name__ == "__main__":
+	unittest.main()
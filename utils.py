@@ -1,38 +1,134 @@
+import json
+import logging
+import logging.handlers
 import os
+import sys
+
+import metrics
+import progress
+from objects import vec_type
+
+
+# records kept in memory before being written, when output is buffered
+LOG_BUFFER = 512
+
+log = logging.getLogger("unitypack-scripts")
+log.propagate = False
+
+
+class Lazy:
+	"""Defers a call until the log message using it is formatted
+
+	e.g. debug("keywords %s", Lazy(" ".join, keywords))
+	"""
+	__slots__ = ("func", "args")
+
+	def __init__(self, func, *args):
+		self.func = func
+		self.args = args
+
+	def __str__(self):
+		return str(self.func(*self.args))
+
+	def __repr__(self):
+		return repr(self.func(*self.args))
+
+
+class TextFormatter(logging.Formatter):
+	def format(self, record):
+		return record.getMessage()
+
+
+class JsonFormatter(logging.Formatter):
+	"""A json object per record, with the structured fields at the top level"""
+
+	def format(self, record):
+		entry = {
+			"time": record.created,
+			"level": record.levelname.lower(),
+			"message": record.getMessage(),
+		}
+		entry.update(getattr(record, "fields", None) or {})
+		return json.dumps(entry, default=str)
 
 
 class Echo:
+	"""Console output, on top of the logging module
+
+	Messages take %-style arguments, which are only formatted when the message
+	is shown, and keyword fields, which are only shown in json logs. Filtered
+	levels return before anything is formatted.
+	"""
 	quiet = False
 	very_quiet = False
 	hide_errors = False
+	handler = None
 
 	@classmethod
 	def echo(cls):
 		return (cls.debug, cls.info, cls.error)
 
 	@classmethod
-	def debug(cls, message):
+	def configure(cls, quiet=False, very_quiet=False, json=False, buffered=None, stream=None):
+		"""Set the levels and the output, buffered defaults to when not on a tty
+
+		Messages go to stderr by default, leaving stdout to the scripts' results.
+		"""
+		cls.quiet = quiet
+		cls.very_quiet = very_quiet
+		stream = stream or sys.stderr
+		handler = logging.StreamHandler(stream)
+		handler.setFormatter(JsonFormatter() if json else TextFormatter())
+		if buffered is None:
+			buffered = not (hasattr(stream, "isatty") and stream.isatty())
+		if buffered:
+			handler = logging.handlers.MemoryHandler(LOG_BUFFER, logging.ERROR, handler)
+		if cls.handler:
+			cls.handler.close()
+			log.removeHandler(cls.handler)
+		cls.handler = handler
+		log.addHandler(handler)
+		log.setLevel(logging.DEBUG)
+
+	@classmethod
+	def flush(cls):
+		if cls.handler:
+			cls.handler.flush()
+
+	@classmethod
+	def _log(cls, level, message, args, fields):
+		if cls.handler is None:
+			cls.configure(cls.quiet, cls.very_quiet, buffered=False)
+		log.log(level, message, *args, extra={"fields": fields} if fields else None)
+
+	@classmethod
+	def debug(cls, message, *args, **fields):
 		if not cls.quiet and not cls.very_quiet:
-			print(message)
+			cls._log(logging.DEBUG, message, args, fields)
 
 	@classmethod
-	def info(cls, message):
+	def info(cls, message, *args, **fields):
 		if not cls.very_quiet:
-			print(message)
+			cls._log(logging.INFO, message, args, fields)
 
 	@classmethod
-	def error(cls, message):
+	def error(cls, message, *args, **fields):
 		if not cls.hide_errors:
-			print(message)
+			cls._log(logging.ERROR, message, args, fields)
 
 
 def write_to_file(path, contents, mode="w"):
+	"""Write contents to path, returns the size of the file in bytes"""
 	if os.path.isfile(path):
-		Echo.info("WARNING: %s exists and will be overwritten" % (path))
+		Echo.info("WARNING: %s exists and will be overwritten", path)
 	encoding = None if "b" in mode else "utf-8"
 	with open(path, mode, encoding=encoding) as f:
-		written = f.write(contents)
-	Echo.debug("Written %i bytes to %r" % (written, path))
+		f.write(contents)
+		f.flush()
+		# the encoded size, write() returns characters in text mode
+		written = os.fstat(f.fileno()).st_size
+	Echo.debug("Written %i bytes to %r", written, path, path=path, bytes=written)
+	return written
 
 
 def filename_no_ext(path):
@@ -41,22 +137,99 @@ def filename_no_ext(path):
 
 def make_dirs(path):
 	dirs = os.path.dirname(path)
-	if not os.path.exists(dirs):
-		os.makedirs(dirs)
+	if dirs and not os.path.exists(dirs):
+		os.makedirs(dirs, exist_ok=True)
 		return True
 	return False
 
 
+def iter_objects(asset, types=None, ids=None, read=True):
+	"""Yield (id, type, object) for the objects in asset, one at a time
+
+	Objects not in types (when given) are never read. Nothing is kept once the
+	consumer moves on to the next object, so memory use is bound by the
+	largest single object rather than the whole asset.
+	"""
+	objects = asset.objects
+	if ids is None:
+		ids = list(objects.keys())
+	for id in ids:
+		obj = objects[id]
+		try:
+			otype = obj.type
+		except Exception as e:
+			Echo.error("%s '%s'", id, e, id=id)
+			continue
+		if types is not None and otype not in types:
+			continue
+		if read:
+			try:
+				with metrics.timer("read"):
+					d = obj.read()
+				metrics.count("objects")
+			except Exception as e:
+				Echo.error("%s '%s'", id, e, id=id)
+				progress.update(getattr(obj, "size", 0))
+				continue
+		else:
+			d = obj
+		yield id, otype, d
+		progress.update(getattr(obj, "size", 0))
+		release_object(d)
+		del d
+	release_asset(asset)
+
+
+def release_object(d):
+	"""Drop any payload cached on a decoded object (texture/audio data)"""
+	attrs = getattr(d, "__dict__", None)
+	if attrs:
+		attrs.pop("_data", None)
+
+
+def release_asset(asset):
+	"""Drop the decompressed block held by the asset's bundle storage"""
+	storage = getattr(getattr(asset, "_buf", None), "buf", None)
+	if hasattr(storage, "current_block") and hasattr(storage, "current_stream"):
+		storage.current_block = None
+		storage.current_stream = None
+
+
+def read_asset_data(asset, offset, size):
+	"""size undecoded bytes at offset in the asset's data
+
+	unitypack has no public API for this, it reads the asset's private
+	buffer; callers sharing an asset between threads must hold a lock.
+	"""
+	buf = asset._buf
+	buf.seek(asset._buf_ofs + offset)
+	return buf.read(size)
+
+
 def vec_from_dict(d, precision=None):
-	from objects import Vec2, Vec3, Vec4, Color
-
-	dim = len(d)
-	if dim == 2:
-		return Vec2(d["x"], d["y"])
-	elif dim == 3:
-		return Vec3(d["x"], d["y"], d["z"])
-	elif dim == 4:
-		if "x" in d:
-			return Vec4(d["x"], d["y"], d["z"], d["w"])
-		elif "r" in d:
-			return Color(d["r"], d["g"], d["b"], d["a"])
+	vec = vec_type(d)
+	if vec is not None:
+		return vec(*(d[k] for k in vec.keys))
+
+
+def plain_json(obj):
+	"""Convert obj to plain dicts and lists in one pass, using to_json()
+
+	The result is encoded without a default() call per object.
+	"""
+	if isinstance(obj, dict):
+		return {k: plain_json(v) for k, v in obj.items()}
+	if isinstance(obj, (list, tuple)):
+		return [plain_json(v) for v in obj]
+	to_json = getattr(obj, "to_json", None)
+	if to_json is not None:
+		return plain_json(to_json())
+	return obj
+
+
+def dump_json(obj, compact=False):
+	"""obj as json, compact output is encoded by the C encoder (indented
+	output always goes through the pure Python one)"""
+	if compact:
+		return json.dumps(plain_json(obj), separators=(",", ":"))
+	return json.dumps(plain_json(obj), indent=4)